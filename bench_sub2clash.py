@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmarks for sub2clash.
+
+Usage:
+    python bench_sub2clash.py generate --lines 100000 --output sub.txt
+    python bench_sub2clash.py suite --sizes 100 10000 100000 --json results.json
+    python bench_sub2clash.py compare old.json new.json --threshold 0.15
+    python bench_sub2clash.py parse --lines 100000 --repeat 5
+    python bench_sub2clash.py emitter --sizes 1000 10000 100000
+    python bench_sub2clash.py memory --sizes 10000 100000
+    python bench_sub2clash.py nodes --lines 500000
+    python bench_sub2clash.py names --count 100000
+    python bench_sub2clash.py probe --nodes 200
+    python bench_sub2clash.py schedule --runs 1000
+    python bench_sub2clash.py daemon --jobs 20
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import yaml
+
+import sub2clash
+
+
+def make_proxies(count: int) -> List[sub2clash.Proxy]:
+    """Synthetic proxies shaped like parse_* output, with short CJK names."""
+    regions = ["HK 香港", "JP 日本", "SG 新加坡", "US 美国", "TW 台湾"]
+    proxies: List[sub2clash.Proxy] = []
+    for i in range(count):
+        name = f"{regions[i % len(regions)]} {i:06d}"
+        kind = i % 3
+        if kind == 0:
+            proxies.append(sub2clash.SSProxy(name, f"ss{i}.example.com", 10000 + i % 50000, "aes-256-gcm", f"pw-{i}"))
+        elif kind == 1:
+            proxies.append(
+                sub2clash.VmessProxy(
+                    name,
+                    f"v{i}.example.com",
+                    443,
+                    "11111111-2222-3333-4444-%012d" % i,
+                    tls=True,
+                    network="ws",
+                    ws_path="/ws",
+                    ws_host=f"v{i}.example.com",
+                )
+            )
+        else:
+            proxies.append(
+                sub2clash.TrojanProxy(name, f"t{i}.example.com", 443, f"secret-{i}", sni=f"t{i}.example.com")
+            )
+    return proxies
+
+
+REGIONS = ["🇭🇰 香港", "🇯🇵 日本", "🇸🇬 新加坡", "🇺🇸 美国", "🇹🇼 台湾", "HK", "JP", "US"]
+
+
+def _b64(data: str, urlsafe: bool = True) -> str:
+    raw = data.encode("utf-8")
+    return (base64.urlsafe_b64encode(raw) if urlsafe else base64.b64encode(raw)).decode("ascii").rstrip("=")
+
+
+def make_subscription_lines(count: int, seed: int = 0, malformed: float = 0.02) -> List[str]:
+    """Synthetic share links: a realistic mix of ss/vmess/trojan/ssr plus malformed entries.
+
+    The same ``count`` and ``seed`` always produce the same lines.
+    """
+    rng = random.Random(seed)
+    lines: List[str] = []
+    for i in range(count):
+        name = f"{rng.choice(REGIONS)} {i:06d}"
+        roll = rng.random()
+        if roll < malformed:
+            lines.append(
+                rng.choice(
+                    [
+                        f"vless://{i}@bad.example.com:443#{name}",
+                        f"ss://{_b64('not-a-valid-userinfo')}#{name}",
+                        "vmess://" + _b64("{broken json", urlsafe=False),
+                        f"trojan://missing-port@t{i}.example.com#{name}",
+                        "ssr://" + _b64(f"s{i}.example.com:8388:auth_aes128_md5:aes-256-cfb:tls1.2_ticket_auth:{_b64('pw')}"),
+                    ]
+                )
+            )
+        elif roll < 0.35:
+            host, port = f"ss{i}.example.com", 10000 + i % 50000
+            cipher = rng.choice(["aes-256-gcm", "aes-128-gcm", "chacha20-ietf-poly1305"])
+            if rng.random() < 0.5:
+                lines.append(f"ss://{_b64(f'{cipher}:pw-{i}@{host}:{port}')}#{quote(name)}")
+            else:
+                lines.append(f"ss://{cipher}:pw-{i}@{host}:{port}#{quote(name)}")
+        elif roll < 0.7:
+            node = {
+                "v": "2",
+                "ps": name,
+                "add": f"v{i}.example.com",
+                "port": str(rng.choice([443, 8443, 2053])),
+                "id": "11111111-2222-3333-4444-%012d" % i,
+                "aid": "0",
+                "net": rng.choice(["ws", "tcp", "grpc"]),
+                "tls": rng.choice(["tls", ""]),
+                "host": f"cdn{i % 10}.example.com",
+                "path": "/ws",
+            }
+            lines.append("vmess://" + _b64(json.dumps(node, ensure_ascii=False), urlsafe=False))
+        elif roll < 0.9:
+            query = rng.choice(["", "?sni=t.example.com", "?type=ws&path=%2Fws&host=t.example.com&sni=t.example.com"])
+            lines.append(f"trojan://secret-{i}@t{i}.example.com:443{query}#{quote(name)}")
+        else:
+            protocol, obfs = rng.choice([("origin", "plain"), ("auth_aes128_md5", "http_simple")])
+            body = f"s{i}.example.com:{8000 + i % 1000}:{protocol}:aes-256-cfb:{obfs}:{_b64(f'pw-{i}')}"
+            lines.append("ssr://" + _b64(f"{body}/?remarks={_b64(name)}&obfsparam={_b64('cdn.example.com')}"))
+    return lines
+
+
+def make_subscription(count: int, seed: int = 0, wrap_base64: bool = True) -> bytes:
+    """A whole subscription body, Base64-wrapped like most providers serve it, or plain."""
+    text = "\n".join(make_subscription_lines(count, seed=seed))
+    return base64.b64encode(text.encode("utf-8")) if wrap_base64 else text.encode("utf-8")
+
+
+def _dump(config: Dict[str, Any], dumper: Any) -> str:
+    buf = io.StringIO()
+    yaml.dump(config, buf, Dumper=dumper, sort_keys=False, allow_unicode=True)
+    return buf.getvalue()
+
+
+def bench_emitter(sizes: List[int]) -> None:
+    """Time the emitters on ``make_proxies`` configs; exits non-zero if any output differs."""
+    ok = True
+    print(f"{'proxies':>8}  {'python':>9}  {'auto':>9}  {'stream':>9}  identical  round-trip")
+    with tempfile.TemporaryDirectory() as tmp:
+        stream_path = os.path.join(tmp, "stream.yaml")
+        for size in sizes:
+            proxies = make_proxies(size)
+            config = sub2clash.build_minimal_clash_yaml(proxies, "bench")
+
+            t0 = time.perf_counter()
+            slow = _dump(config, yaml.SafeDumper)
+            t1 = time.perf_counter()
+            fast = _dump(config, sub2clash.select_yaml_dumper(config, "auto"))
+            t2 = time.perf_counter()
+            sub2clash.write_clash_yaml_stream(proxies, "bench", stream_path)
+            t3 = time.perf_counter()
+
+            loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            with open(stream_path, "r", encoding="utf-8") as f:
+                round_trip = yaml.load(f, Loader=loader) == config
+            ok = ok and slow == fast and round_trip
+            print(
+                f"{size:>8}  {t1 - t0:>8.3f}s  {t2 - t1:>8.3f}s  {t3 - t2:>8.3f}s  "
+                f"{str(slow == fast):>9}  {round_trip}"
+            )
+    if not ok:
+        raise SystemExit(1)
+
+
+def _peak_memory(func: Any) -> Tuple[float, float]:
+    """Run ``func`` under tracemalloc and return ``(peak MiB, seconds)``."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        func()
+    finally:
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak / (1024 * 1024), elapsed
+
+
+def bench_memory(sizes: List[int]) -> None:
+    print(f"{'lines':>8}  {'buffered':>12}  {'stream':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "sub.txt")
+        output = os.path.join(tmp, "clash.yaml")
+        for size in sizes:
+            with open(source, "wb") as f:
+                f.write(base64.b64encode("\n".join(make_subscription_lines(size)).encode()))
+            results = []
+            for stream in (False, True):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results.append(_peak_memory(lambda: sub2clash.run_once(source, output, "bench", stream=stream)))
+            print("  ".join([f"{size:>8}"] + [f"{peak:>7.1f} MiB ({secs:.1f}s)" for peak, secs in results]))
+
+
+def bench_nodes(count: int, seed: int) -> None:
+    """Memory held by the parsed node list itself (the input lines are excluded)."""
+    lines = make_subscription_lines(count, seed=seed)
+    tracemalloc.start()
+    try:
+        proxies, warnings = sub2clash.parse_lines_to_proxies(lines, allow_native_ssr=True)
+        del warnings
+        held = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    print(
+        f"{count} lines -> {len(proxies)} nodes: {held / (1024 * 1024):.1f} MiB retained, "
+        f"{held / max(1, len(proxies)):.0f} B/node"
+    )
+
+
+def bench_names(count: int) -> None:
+    """``ensure_unique_names`` on ``count`` nodes that are all called "SS"."""
+    proxies = [sub2clash.SSProxy("SS", f"ss{i}.example.com", 443, "aes-256-gcm", "pw") for i in range(count)]
+    t0 = time.perf_counter()
+    renamed = sub2clash.ensure_unique_names(proxies)
+    elapsed = time.perf_counter() - t0
+    print(f"{count} identical names: {renamed} renamed in {elapsed * 1000:.1f} ms")
+
+
+def bench_probe(count: int, concurrency: int, seed: int) -> None:
+    """Probe ``count`` stand-in nodes that all point at one local listener.
+
+    Each node gets an injected connect delay; a fifth of them are slower than the
+    per-node timeout, and the deadline cuts the round short. Checks that reachable
+    nodes come back sorted by their delay and that the deadline is respected.
+    """
+    listener = socket.create_server(("127.0.0.1", 0), backlog=1024)
+    port = listener.getsockname()[1]
+
+    def accept_forever() -> None:
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            conn.close()
+
+    threading.Thread(target=accept_forever, daemon=True).start()
+
+    rng = random.Random(seed)
+    settings = sub2clash.ProbeSettings(timeout=0.5, deadline=2.0, concurrency=concurrency, group_size=10)
+    # distinct delays 10 ms apart keep the expected order unambiguous
+    delays = [0.01 * i for i in range(count)]
+    rng.shuffle(delays)
+    for i in rng.sample(range(count), count // 5):
+        delays[i] = settings.timeout + 1.0
+    proxies = [sub2clash.SSProxy(f"node {i}", f"node{i}.test", 443, "aes-256-gcm", "pw") for i in range(count)]
+
+    async def connect(host: str, _port: int) -> None:
+        await asyncio.sleep(delays[int(host[4:-5])])
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.close()
+
+    t0 = time.perf_counter()
+    latencies = sub2clash.probe_latency(proxies, settings, connect=connect)
+    elapsed = time.perf_counter() - t0
+    listener.close()
+
+    config = sub2clash.build_minimal_clash_yaml(proxies, "bench", latencies, settings)
+    select, auto = config["proxy-groups"]
+    ranked = [name for name in select["proxies"] if name.startswith("node ")]
+    reachable = [lat for lat in latencies if lat is not None]
+    by_delay = sorted((d, f"node {i}") for i, d in enumerate(delays) if latencies[i] is not None)
+    ok = (
+        ranked[: len(reachable)] == [name for _, name in by_delay]
+        and auto["proxies"] == ranked[: settings.group_size]
+        and elapsed < settings.deadline + 0.5
+        and all(latencies[i] is None for i, d in enumerate(delays) if d > settings.timeout)
+    )
+    print(
+        f"{count} nodes, concurrency {concurrency}: {len(reachable)} reachable in {elapsed:.2f}s "
+        f"(deadline {settings.deadline:.1f}s), sorted and grouped correctly: {ok}"
+    )
+    if not ok:
+        raise SystemExit(1)
+
+
+def bench_schedule(runs: int, seed: int) -> None:
+    """Drive ``RefreshScheduler`` with a simulated clock and slow conversions.
+
+    Checks that fixed-interval runs stay on their timetable (no drift), that
+    jitter stays within bounds, and that adaptive mode backs off to the cap
+    while nothing changes and returns to the base interval after a change.
+    """
+    rng = random.Random(seed)
+    now = [0.0]
+    interval, jitter = 60.0, 0.1
+
+    def run_fixed(jit: float) -> List[float]:
+        now[0] = 0.0
+        scheduler = sub2clash.RefreshScheduler(interval, jitter=jit, clock=lambda: now[0], rng=random.Random(seed))
+        starts = []
+        for _ in range(runs):
+            now[0] += scheduler.remaining()
+            starts.append(now[0])
+            now[0] += rng.uniform(0.5, 20.0)  # conversion time
+            scheduler.record(sub2clash.RUN_CHANGED)
+        return starts
+
+    plain = run_fixed(0.0)
+    drift = max(abs(t - i * interval) for i, t in enumerate(plain))
+    jittered = run_fixed(jitter)
+    spread = max(abs(t - i * interval) for i, t in enumerate(jittered))
+
+    now[0] = 0.0
+    adaptive = sub2clash.RefreshScheduler(interval, adaptive=True, clock=lambda: now[0])
+    periods = [adaptive.record(sub2clash.RUN_UNCHANGED) for _ in range(6)]
+    periods.append(adaptive.record(sub2clash.RUN_FAILED))
+    periods.append(adaptive.record(sub2clash.RUN_CHANGED))
+    cap = interval * sub2clash.ADAPTIVE_MAX_FACTOR
+    expected = [120.0, 240.0, 480.0, cap, cap, cap, cap, interval]
+
+    ok = drift < 1e-6 and 0 < spread <= jitter * interval + 1e-6 and periods == expected
+    print(
+        f"{runs} runs every {interval:.0f}s: drift {drift:.2e}s, jitter spread {spread:.1f}s "
+        f"(bound {jitter * interval:.0f}s), adaptive periods {periods}: {ok}"
+    )
+    if not ok:
+        raise SystemExit(1)
+
+
+def bench_daemon(jobs: int, seconds: float) -> None:
+    """Run ``Daemon`` with ``jobs`` one-second jobs, one of which takes most of ``seconds`` to convert.
+
+    Conversions are stubbed out with sleeps; checks that every fast job keeps
+    to its one-second timetable while the slow one is running.
+    """
+    runs: Dict[str, List[float]] = {}
+    start = time.monotonic()
+
+    class TimedDaemon(sub2clash.Daemon):
+        def run_job(self, job: sub2clash.DaemonJob) -> int:
+            runs.setdefault(job.name, []).append(time.monotonic() - start)
+            time.sleep(seconds * 0.8 if job.name == "slow" else 0.01)
+            return 0
+
+    specs = [sub2clash.DaemonJob("slow", ["slow.txt"], "slow.yaml", 1.0)]
+    specs += [sub2clash.DaemonJob(f"job {i}", [f"{i}.txt"], f"{i}.yaml", 1.0) for i in range(jobs - 1)]
+    daemon = TimedDaemon(specs, {}, concurrency=4)
+
+    async def run_for() -> None:
+        try:
+            await asyncio.wait_for(daemon.run(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run_for())
+    expected = int(seconds)
+    fast = [len(v) for k, v in runs.items() if k != "slow"]
+    late = max(abs(t - i) for k, v in runs.items() if k != "slow" for i, t in enumerate(v))
+    ok = len(fast) == jobs - 1 and min(fast) >= expected and late < 0.25 and len(runs["slow"]) == 1
+    print(
+        f"{jobs} jobs for {seconds:.0f}s, one converting for {seconds * 0.8:.1f}s: "
+        f"fast jobs ran {min(fast)}-{max(fast)} times, worst lateness {late * 1000:.0f} ms: {ok}"
+    )
+    if not ok:
+        raise SystemExit(1)
+
+
+def _best_of(func: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except Exception:
+        return None
+    return out.stdout.strip() or None
+
+
+def bench_suite(sizes: List[int], repeat: int, seed: int) -> Dict[str, Any]:
+    """Time every public pipeline function and a full ``run_once`` per subscription size."""
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "sub.txt")
+        output = os.path.join(tmp, "clash.yaml")
+        for size in sizes:
+            # big inputs are timed once; a single pass already takes seconds
+            rep = repeat if size <= 100000 else 1
+            body = make_subscription(size, seed=seed)
+            with open(source, "wb") as f:
+                f.write(body)
+            encoded = body.decode("ascii")
+            text = sub2clash.b64decode_to_text(encoded)
+            lines = sub2clash.split_lines_keep_schemes(text)
+            by_scheme: Dict[str, List[str]] = {}
+            for line in lines:
+                by_scheme.setdefault(line.split("://", 1)[0], []).append(line)
+            proxies, _ = sub2clash.parse_lines_to_proxies(lines, allow_native_ssr=True)
+            config = sub2clash.build_minimal_clash_yaml(proxies, "bench")
+
+            def parse_all(func: Callable[[str], Any], items: List[str]) -> Callable[[], None]:
+                def run() -> None:
+                    for item in items:
+                        try:
+                            func(item)
+                        except Exception:
+                            pass
+
+                return run
+
+            timings: Dict[str, float] = {
+                "b64decode_to_text": _best_of(lambda: sub2clash.b64decode_to_text(encoded), rep),
+                "split_lines_keep_schemes": _best_of(lambda: sub2clash.split_lines_keep_schemes(text), rep),
+                "parse_ss": _best_of(parse_all(sub2clash.parse_ss, by_scheme.get("ss", [])), rep),
+                "parse_vmess": _best_of(parse_all(sub2clash.parse_vmess, by_scheme.get("vmess", [])), rep),
+                "parse_trojan": _best_of(parse_all(sub2clash.parse_trojan, by_scheme.get("trojan", [])), rep),
+                "parse_ssr": _best_of(parse_all(sub2clash.parse_ssr, by_scheme.get("ssr", [])), rep),
+                "parse_lines_to_proxies": _best_of(lambda: sub2clash.parse_lines_to_proxies(lines), rep),
+                "build_minimal_clash_yaml": _best_of(lambda: sub2clash.build_minimal_clash_yaml(proxies, "bench"), rep),
+                "write_yaml_to_file": _best_of(lambda: sub2clash.write_yaml_to_file(config, output), rep),
+            }
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                timings["run_once"] = _best_of(lambda: sub2clash.run_once(source, output, "bench"), rep)
+                timings["run_once_stream"] = _best_of(lambda: sub2clash.run_once(source, output, "bench", stream=True), rep)
+            results[str(size)] = timings
+
+            print(f"{size} lines ({len(proxies)} proxies):")
+            for func_name, seconds in timings.items():
+                print(f"  {func_name:<26} {seconds * 1000:12.2f} ms")
+
+    return {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "libyaml": bool(getattr(yaml, "__with_libyaml__", False)),
+            "seed": seed,
+            "repeat": repeat,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def bench_parse(count: int, repeat: int, seed: int) -> Dict[str, float]:
+    """Per-line cost of each parser and of the whole parse loop, in microseconds."""
+    lines = make_subscription_lines(count, seed=seed)
+    by_scheme: Dict[str, List[str]] = {}
+    for line in lines:
+        by_scheme.setdefault(sub2clash.line_scheme(line), []).append(line)
+    parsers: Dict[str, Callable[[str], Any]] = {
+        "ss": sub2clash.parse_ss,
+        "vmess": sub2clash.parse_vmess,
+        "trojan": sub2clash.parse_trojan,
+        "ssr": lambda line: sub2clash.parse_ssr(line, allow_native_ssr=True),
+    }
+    results: Dict[str, float] = {}
+    for scheme, func in parsers.items():
+        items = by_scheme.get(scheme, [])
+        if not items:
+            continue
+
+        def run(items: List[str] = items, func: Callable[[str], Any] = func) -> None:
+            for item in items:
+                try:
+                    func(item)
+                except Exception:
+                    pass
+
+        results[f"parse_{scheme}"] = _best_of(run, repeat) / len(items) * 1e6
+    results["parse_lines_to_proxies"] = (
+        _best_of(lambda: sub2clash.parse_lines_to_proxies(lines, allow_native_ssr=True), repeat) / len(lines) * 1e6
+    )
+    print(f"{count} lines, best of {repeat}:")
+    for func_name, micros in results.items():
+        print(f"  {func_name:<26} {micros:8.2f} µs/line")
+    return results
+
+
+def compare_results(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> int:
+    """Print per-function ratios new/old; return the number of regressions beyond ``threshold``."""
+    regressions = 0
+    print(f"{'size':>8}  {'function':<26} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+    for size, new_timings in new["results"].items():
+        old_timings = old["results"].get(size, {})
+        for func_name, new_seconds in new_timings.items():
+            old_seconds = old_timings.get(func_name)
+            if not old_seconds:
+                continue
+            ratio = new_seconds / old_seconds
+            flag = ""
+            if ratio > 1 + threshold:
+                regressions += 1
+                flag = "  <-- 变慢"
+            print(
+                f"{size:>8}  {func_name:<26} {old_seconds * 1000:10.2f} {new_seconds * 1000:10.2f} {ratio:6.2f}x{flag}"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="sub2clash 性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_generate = sub.add_parser("generate", help="生成合成订阅文件（ss/vmess/trojan/ssr 混合，含异常条目）")
+    p_generate.add_argument("--lines", type=int, default=10000)
+    p_generate.add_argument("--seed", type=int, default=0)
+    p_generate.add_argument("--plain", action="store_true", help="输出明文链接列表，而不是 Base64 包装")
+    p_generate.add_argument("--output", required=True)
+
+    p_suite = sub.add_parser("suite", help="对各公开函数及完整 run_once 计时，可输出 JSON 供跨提交比较")
+    p_suite.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    p_suite.add_argument("--repeat", type=int, default=3, help="每项取最好成绩的重复次数（10 万行以上只跑一次）")
+    p_suite.add_argument("--seed", type=int, default=0)
+    p_suite.add_argument("--json", help="将结果写入 JSON 文件")
+
+    p_parse = sub.add_parser("parse", help="逐行解析的微基准（每行耗时，微秒）")
+    p_parse.add_argument("--lines", type=int, default=100000)
+    p_parse.add_argument("--repeat", type=int, default=5)
+    p_parse.add_argument("--seed", type=int, default=0)
+
+    p_nodes = sub.add_parser("nodes", help="解析后节点列表常驻内存（tracemalloc）")
+    p_nodes.add_argument("--lines", type=int, default=500000)
+    p_nodes.add_argument("--seed", type=int, default=0)
+
+    p_names = sub.add_parser("names", help="大量同名节点的去重名耗时")
+    p_names.add_argument("--count", type=int, default=100000)
+
+    p_probe = sub.add_parser("probe", help="用本地监听端口与注入延迟检验测速排序与总时限")
+    p_probe.add_argument("--nodes", type=int, default=200)
+    p_probe.add_argument("--concurrency", type=int, default=64)
+    p_probe.add_argument("--seed", type=int, default=0)
+
+    p_schedule = sub.add_parser("schedule", help="用模拟时钟检验定时更新不漂移、抖动范围与自适应间隔")
+    p_schedule.add_argument("--runs", type=int, default=1000)
+    p_schedule.add_argument("--seed", type=int, default=0)
+
+    p_daemon = sub.add_parser("daemon", help="检验守护进程中慢订阅不会拖慢其他订阅的排期")
+    p_daemon.add_argument("--jobs", type=int, default=20)
+    p_daemon.add_argument("--seconds", type=float, default=4.0)
+
+    p_compare = sub.add_parser("compare", help="比较两份 suite JSON 结果，发现性能回退时返回非零")
+    p_compare.add_argument("old")
+    p_compare.add_argument("new")
+    p_compare.add_argument("--threshold", type=float, default=0.15, help="允许的相对变慢比例（默认 0.15）")
+
+    p_emitter = sub.add_parser("emitter", help="比较纯 Python、libyaml 与流式写出的耗时，并校验一致性")
+    p_emitter.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+
+    p_memory = sub.add_parser("memory", help="用 tracemalloc 比较普通模式与 --stream 的峰值内存")
+    p_memory.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        with open(args.output, "wb") as f:
+            f.write(make_subscription(args.lines, seed=args.seed, wrap_base64=not args.plain))
+    elif args.command == "suite":
+        report = bench_suite(args.sizes, max(1, args.repeat), args.seed)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    elif args.command == "parse":
+        bench_parse(args.lines, max(1, args.repeat), args.seed)
+    elif args.command == "nodes":
+        bench_nodes(args.lines, args.seed)
+    elif args.command == "names":
+        bench_names(args.count)
+    elif args.command == "probe":
+        bench_probe(args.nodes, max(1, args.concurrency), args.seed)
+    elif args.command == "schedule":
+        bench_schedule(max(1, args.runs), args.seed)
+    elif args.command == "daemon":
+        bench_daemon(max(2, args.jobs), max(2.0, args.seconds))
+    elif args.command == "compare":
+        with open(args.old, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, "r", encoding="utf-8") as f:
+            new = json.load(f)
+        sys.exit(1 if compare_results(old, new, args.threshold) else 0)
+    elif args.command == "emitter":
+        bench_emitter(args.sizes)
+    elif args.command == "memory":
+        bench_memory(args.sizes)
+
+
+if __name__ == "__main__":
+    main()
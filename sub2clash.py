@@ -2,14 +2,39 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import asyncio
 import base64
+import codecs
+import cProfile
+import ctypes
+import ctypes.util
+import gzip
+import hashlib
+import http.server
+import itertools
 import json
+import multiprocessing
+import os
+import pickle
+import random
+import threading
 import time
 from datetime import datetime
 import re
+import select
+import signal
+import struct
 import sys
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+import tempfile
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field, replace
+from functools import lru_cache, partial
+from importlib.metadata import entry_points
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple, Union
+from urllib.parse import parse_qs, quote, unquote, urlparse, urlsplit
 
 try:
     import requests
@@ -21,6 +46,29 @@ try:
 except Exception:  # pragma: no cover
     yaml = None  # type: ignore
 
+try:
+    # urllib3 transparently decodes "br" responses when either package is present
+    import brotli  # noqa: F401
+
+    HAS_BROTLI = True
+except Exception:  # pragma: no cover
+    try:
+        import brotlicffi  # noqa: F401
+
+        HAS_BROTLI = True
+    except Exception:
+        HAS_BROTLI = False
+
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "sub2clash",
+)
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_NON_DIGITS_RE = re.compile(r"[^0-9]")
+
 
 def b64decode_to_text(data: str) -> str:
     """Decode Base64 with forgiving padding/newlines, return UTF-8 text.
@@ -28,7 +76,7 @@ def b64decode_to_text(data: str) -> str:
     Subscription contents and vmess/ssr often miss padding and include newlines.
     """
     # remove URL-safe differences and whitespace
-    data_stripped = re.sub(r"\s+", "", data)
+    data_stripped = _WHITESPACE_RE.sub("", data)
     # Add padding
     padding = (-len(data_stripped)) % 4
     data_stripped += "=" * padding
@@ -39,24 +87,17 @@ def b64decode_to_text(data: str) -> str:
         return base64.b64decode(data_stripped.encode("utf-8")).decode("utf-8", errors="ignore")
 
 
-def fetch_subscription_text(url_or_path: str, timeout: int = 15) -> str:
-    """Fetch subscription text from URL or read local file. Returns raw text.
+def is_local_source(url_or_path: str) -> bool:
+    return bool(re.match(r"^(?:/|\./|\../|[A-Za-z]:\\)", url_or_path)) or url_or_path.startswith("file://")
+
+
+def decode_subscription_bytes(raw: bytes) -> str:
+    """Decode raw subscription bytes to text.
 
     If the result appears to be base64 of lines of scheme URLs, decode it.
     """
-    # Local file
-    if re.match(r"^(?:/|\./|\../|[A-Za-z]:\\)", url_or_path) or url_or_path.startswith("file://"):
-        path = url_or_path.replace("file://", "")
-        with open(path, "rb") as f:
-            raw = f.read()
-        text = raw.decode("utf-8", errors="ignore")
-    else:
-        if requests is None:
-            raise RuntimeError("requests 未安装，请先安装依赖：pip install -r requirements.txt")
-        resp = requests.get(url_or_path, timeout=timeout)
-        resp.raise_for_status()
-        # many providers return bytes with unknown encoding
-        text = resp.content.decode("utf-8", errors="ignore")
+    # many providers return bytes with unknown encoding
+    text = raw.decode("utf-8", errors="ignore")
 
     # Heuristic: if contains "://" already, assume plain list
     if "://" in text:
@@ -68,382 +109,3344 @@ def fetch_subscription_text(url_or_path: str, timeout: int = 15) -> str:
     return decoded if "://" in decoded else text
 
 
-def split_lines_keep_schemes(text: str) -> List[str]:
-    # providers may join by newlines or return a single line with many entries
-    # Split on newlines, also handle CRLF, and filter empty
-    lines = re.split(r"\r?\n", text)
-    # Some providers concatenate with multiple spaces; split further
-    result: List[str] = []
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        if line.count("://") > 1 and not line.startswith("ssr://") and not line.startswith("vmess://"):
-            # split by spaces
-            parts = [p for p in re.split(r"\s+", line) if p]
-            result.extend(parts)
-        else:
-            result.append(line)
-    return result
-
-
-def percent_decode(s: str) -> str:
-    try:
-        from urllib.parse import unquote
+@dataclass
+class FetchResult:
+    """Raw subscription bytes plus whether the server answered 304 Not Modified.
 
-        return unquote(s)
-    except Exception:
-        return s
+    ``url`` is the mirror that actually served the subscription.
+    """
 
+    raw: bytes
+    not_modified: bool = False
+    url: str = ""
 
-def parse_name_from_fragment(url: str) -> Optional[str]:
-    if "#" in url:
-        return percent_decode(url.split("#", 1)[1]) or None
-    return None
+    @property
+    def text(self) -> str:
+        return decode_subscription_bytes(self.raw)
 
 
-def parse_query(url: str) -> Dict[str, str]:
-    from urllib.parse import urlparse, parse_qs
+def _fetch_cache_paths(cache_dir: str, url: str) -> Tuple[str, str]:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+    base = os.path.join(cache_dir, "fetch", key)
+    return base + ".json", base + ".body"
 
-    q = urlparse(url).query
-    out: Dict[str, str] = {}
-    if not q:
-        return out
-    pairs = parse_qs(q)
-    for k, v in pairs.items():
-        if not v:
-            continue
-        out[k] = v[0]
-    return out
 
+def _load_fetch_meta(cache_dir: str, url: str) -> Optional[Dict[str, str]]:
+    meta_path, body_path = _fetch_cache_paths(cache_dir, url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("url") != url or not os.path.exists(body_path):
+        return None
+    return meta
 
-def parse_ss(url: str) -> Optional[Dict[str, Any]]:
-    # ss://[base64(method:password@host:port)] or ss://method:password@host:port?plugin=...#name
-    assert url.startswith("ss://")
-    body = url[len("ss://") :]
-    name = parse_name_from_fragment(url) or "SS"
-    # remove fragment and query from body for core parsing
-    body_clean = body.split("#", 1)[0]
-    query = parse_query(url)
 
-    # If contains '@' it is non-encoded userinfo
-    parsed: Optional[Tuple[str, str, str, int]] = None
-    candidate = body_clean
-    if candidate.startswith("-"):
-        # e.g., clash-format lines. Not typical here; skip
+def _load_fetch_cache(cache_dir: str, url: str) -> Optional[Tuple[Dict[str, str], bytes]]:
+    meta = _load_fetch_meta(cache_dir, url)
+    if meta is None:
         return None
     try:
-        if "@" not in candidate:
-            # base64 userinfo@server
-            decoded = b64decode_to_text(candidate.split("?", 1)[0])
-            candidate2 = decoded
-        else:
-            candidate2 = candidate
-        # method:password@host:port
-        if "@" not in candidate2:
-            return None
-        userinfo, server = candidate2.split("@", 1)
-        method, password = userinfo.split(":", 1)
-        if ":" not in server:
-            return None
-        host, port_str = server.rsplit(":", 1)
-        port = int(re.sub(r"[^0-9]", "", port_str))
-        parsed = (method, password, host, port)
-    except Exception:
-        parsed = None
-
-    if not parsed:
+        with open(_fetch_cache_paths(cache_dir, url)[1], "rb") as f:
+            return meta, f.read()
+    except OSError:
         return None
 
-    method, password, host, port = parsed
-    proxy: Dict[str, Any] = {
-        "name": name,
-        "type": "ss",
-        "server": host,
-        "port": port,
-        "cipher": method,
-        "password": password,
-    }
-    # plugin support (simple)
-    plugin = query.get("plugin")
-    if plugin:
-        proxy["plugin"] = plugin
-        # Optional plugin-opts not fully parsed here; many clients accept just plugin
-    return proxy
 
+def _cache_temp_file(path: str) -> Tuple[int, str]:
+    # a fresh name per write, so runs sharing a cache dir never write into the same temp file
+    return tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
 
-def parse_vmess(url: str) -> Optional[Dict[str, Any]]:
-    assert url.startswith("vmess://")
-    body = url[len("vmess://") :]
+
+def _discard(path: str) -> None:
     try:
-        data = json.loads(b64decode_to_text(body))
-    except Exception:
-        return None
-    name = data.get("ps") or "VMess"
-    server = data.get("add")
-    port = int(str(data.get("port") or 0) or 0)
-    uuid = data.get("id")
-    aid = int(str(data.get("aid") or 0) or 0)
-    net = data.get("net") or "tcp"
-    tls_flag = (data.get("tls") or "").lower() in ("tls", "reality")
-    sni = data.get("sni") or data.get("peer") or None
-    host = data.get("host") or data.get("sni") or None
-    path = data.get("path") or "/"
-    alpn = data.get("alpn")
+        os.remove(path)
+    except OSError:
+        pass
 
-    if not server or not port or not uuid:
-        return None
 
-    proxy: Dict[str, Any] = {
-        "name": name,
-        "type": "vmess",
-        "server": server,
-        "port": port,
-        "uuid": uuid,
-        "alterId": aid,
-        "cipher": "auto",
-    }
-    if tls_flag:
-        proxy["tls"] = True
-    if sni:
-        proxy["servername"] = sni
-    if alpn:
-        # clash expects list
-        if isinstance(alpn, str):
-            proxy["alpn"] = [alpn]
-        elif isinstance(alpn, list):
-            proxy["alpn"] = alpn
+def _write_cache_file(path: str, data: bytes) -> None:
+    fd, tmp_path = _cache_temp_file(path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
 
-    network = (net or "tcp").lower()
-    if network == "ws":
-        proxy["network"] = "ws"
-        ws_opts: Dict[str, Any] = {"path": path or "/"}
-        if host:
-            ws_opts["headers"] = {"Host": host}
-        proxy["ws-opts"] = ws_opts
-    elif network == "grpc":
-        proxy["network"] = "grpc"
-        if path:
-            proxy["grpc-opts"] = {"grpc-service-name": path.strip("/")}
 
-    return proxy
+def _write_fetch_meta(cache_dir: str, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+    meta = {"url": url, "etag": etag, "last_modified": last_modified}
+    _write_cache_file(_fetch_cache_paths(cache_dir, url)[0], json.dumps(meta).encode("utf-8"))
 
 
-def parse_trojan(url: str) -> Optional[Dict[str, Any]]:
-    assert url.startswith("trojan://")
-    name = parse_name_from_fragment(url) or "Trojan"
-    query = parse_query(url)
-    body = url[len("trojan://") :].split("#", 1)[0]
-    # password@host:port
+def _save_fetch_cache(cache_dir: str, url: str, etag: Optional[str], last_modified: Optional[str], raw: bytes) -> None:
+    meta_path, body_path = _fetch_cache_paths(cache_dir, url)
+    if not etag and not last_modified:
+        # Nothing to revalidate with; drop any stale entry
+        forget_fetch_cache(cache_dir, url)
+        return
     try:
-        if "@" not in body:
-            return None
-        password, server_part = body.split("@", 1)
-        if ":" not in server_part:
-            return None
-        host, port_str = server_part.rsplit(":", 1)
-        port = int(re.sub(r"[^0-9]", "", port_str))
-    except Exception:
-        return None
-    proxy: Dict[str, Any] = {
-        "name": name,
-        "type": "trojan",
-        "server": host,
-        "port": port,
-        "password": percent_decode(password),
-        "udp": True,
-        "sni": query.get("sni") or query.get("peer") or host,
-        "skip-cert-verify": False,
-    }
-    alpn = query.get("alpn")
-    if alpn:
-        proxy["alpn"] = alpn.split(",")
-    # Basic ws/grpc support if present
-    type_q = (query.get("type") or query.get("transport") or "").lower()
-    if type_q == "ws":
-        proxy["network"] = "ws"
-        ws_opts: Dict[str, Any] = {}
-        if query.get("path"):
-            ws_opts["path"] = query.get("path")
-        host_hdr = query.get("host") or query.get("sni")
-        if host_hdr:
-            ws_opts["headers"] = {"Host": host_hdr}
-        if ws_opts:
-            proxy["ws-opts"] = ws_opts
-    elif type_q == "grpc":
-        proxy["network"] = "grpc"
-        if query.get("serviceName") or query.get("service"):
-            proxy["grpc-opts"] = {"grpc-service-name": query.get("serviceName") or query.get("service")}
-    return proxy
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        # body first, so a metadata file never points at a missing/partial body
+        _write_cache_file(body_path, raw)
+        _write_fetch_meta(cache_dir, url, etag, last_modified)
+    except OSError:
+        # cache is best-effort
+        pass
 
 
-def parse_ssr(url: str, allow_native_ssr: bool = False) -> Optional[Dict[str, Any]]:
-    # Convert SSR only if protocol=origin and obfs=plain -> as SS
-    assert url.startswith("ssr://")
-    body = url[len("ssr://") :]
-    try:
-        decoded = b64decode_to_text(body)
-    except Exception:
-        return None
-    # server:port:protocol:method:obfs:base64pass/?params
-    try:
-        main, _, params = decoded.partition("/")
-        server, port, protocol, method, obfs, pwd_b64 = main.split(":", 5)
-        password = b64decode_to_text(pwd_b64)
-        # remarks
-        name = "SSR"
-        if params.startswith("?"):
-            params_qs = params[1:]
-            pairs = dict(
-                (k, v) for k, _, v in [p.partition("=") for p in params_qs.split("&") if p]
-            )
-            if "remarks" in pairs:
-                name = b64decode_to_text(pairs.get("remarks", "")) or name
-            obfsparam = b64decode_to_text(pairs.get("obfsparam", "")) if "obfsparam" in pairs else ""
-            protoparam = b64decode_to_text(pairs.get("protoparam", "")) if "protoparam" in pairs else ""
-    except Exception:
-        return None
+def forget_fetch_cache(cache_dir: str, url: str) -> None:
+    for path in _fetch_cache_paths(cache_dir, url):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
-    if allow_native_ssr:
-        # Output Clash Meta native SSR format
+
+def _conditional_headers(meta: Optional[Dict[str, str]]) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+@dataclass
+class HttpPolicy:
+    """Connection pooling and retry settings shared by every HTTP fetch."""
+
+    pool_size: int = 10
+    hedge_delay: float = 0.0
+    retries: int = 2
+    backoff: float = 1.0
+    backoff_max: float = 60.0
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+
+_HTTP_POLICY = HttpPolicy()
+_HTTP_SESSION: Any = None
+_HTTP_SESSION_LOCK = threading.Lock()
+
+
+def configure_http(**kwargs: Any) -> HttpPolicy:
+    """Update the process-wide ``HttpPolicy``; the session is rebuilt on next use."""
+    global _HTTP_POLICY, _HTTP_SESSION
+    with _HTTP_SESSION_LOCK:
+        _HTTP_POLICY = HttpPolicy(**{**_HTTP_POLICY.__dict__, **kwargs})
+        if _HTTP_SESSION is not None:
+            _HTTP_SESSION.close()
+            _HTTP_SESSION = None
+    return _HTTP_POLICY
+
+
+def get_http_session() -> Any:
+    """Long-lived keep-alive ``requests.Session``, so refreshes reuse TCP/TLS connections."""
+    global _HTTP_SESSION
+    if requests is None:
+        raise RuntimeError("requests 未安装，请先安装依赖：pip install -r requirements.txt")
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            session = requests.Session()
+            size = max(1, _HTTP_POLICY.pool_size)
+            # retries are handled in http_get, with jitter
+            adapter = requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["Accept-Encoding"] = "gzip, deflate, br" if HAS_BROTLI else "gzip, deflate"
+            _HTTP_SESSION = session
+        return _HTTP_SESSION
+
+
+def _retry_delay(attempt: int, resp: Any = None) -> float:
+    policy = _HTTP_POLICY
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), policy.backoff_max)
+    # exponential backoff with "equal jitter": half fixed, half random
+    delay = min(policy.backoff * (2 ** attempt), policy.backoff_max)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def http_get(url: str, timeout: int = 15, headers: Optional[Dict[str, str]] = None, stream: bool = False) -> Any:
+    """GET through the pooled session, retrying connection errors and retryable statuses."""
+    session = get_http_session()
+    policy = _HTTP_POLICY
+    attempt = 0
+    while True:
         try:
-            port_i = int(port)
-        except Exception:
-            return None
-        proxy: Dict[str, Any] = {
-            "name": name,
-            "type": "ssr",
-            "server": server,
-            "port": port_i,
-            "cipher": method,
-            "password": password,
-            "protocol": protocol,
-            "obfs": obfs,
-            "udp": True,
-        }
-        if 'obfsparam' in locals() and obfsparam:
-            proxy["obfs-param"] = obfsparam
-        if 'protoparam' in locals() and protoparam:
-            proxy["protocol-param"] = protoparam
-        return proxy
+            resp = session.get(url, timeout=timeout, headers=headers, stream=stream)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= policy.retries:
+                raise
+            time.sleep(_retry_delay(attempt))
+        else:
+            if resp.status_code not in policy.retry_statuses or attempt >= policy.retries:
+                return resp
+            delay = _retry_delay(attempt, resp)
+            resp.close()
+            time.sleep(delay)
+        attempt += 1
 
-    if protocol != "origin" or obfs != "plain":
-        return None  # Cannot safely convert to Clash SS
 
+# A subscription source: one URL/path, or several mirror URLs of the same subscription
+Source = Union[str, Sequence[str]]
+
+
+def source_mirrors(source: Source) -> List[str]:
+    return [source] if isinstance(source, str) else list(source)
+
+
+@dataclass
+class MirrorStats:
+    """Per-URL fetch statistics; times are until response headers arrive."""
+
+    attempts: int = 0
+    wins: int = 0
+    losses: int = 0
+    failures: int = 0
+    total_seconds: float = 0.0
+    last_seconds: float = 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        done = self.wins + self.losses
+        return self.total_seconds / done if done else 0.0
+
+
+MIRROR_STATS: Dict[str, MirrorStats] = {}
+_MIRROR_STATS_LOCK = threading.Lock()
+
+
+def mirror_stats() -> Dict[str, MirrorStats]:
+    """Snapshot of fetch statistics for every HTTP URL fetched so far."""
+    with _MIRROR_STATS_LOCK:
+        return {url: MirrorStats(**st.__dict__) for url, st in MIRROR_STATS.items()}
+
+
+def _record_mirror(url: str, outcome: str, seconds: float = 0.0) -> None:
+    with _MIRROR_STATS_LOCK:
+        st = MIRROR_STATS.setdefault(url, MirrorStats())
+        if outcome == "attempt":
+            st.attempts += 1
+            return
+        setattr(st, outcome, getattr(st, outcome) + 1)
+        if outcome != "failures":
+            st.total_seconds += seconds
+            st.last_seconds = seconds
+
+
+def _open_http(url: str, timeout: int, cache_dir: Optional[str]) -> Any:
+    """Send the (conditional) GET and return the response once headers are in; body unread."""
+    meta = _load_fetch_meta(cache_dir, url) if cache_dir else None
+    resp = http_get(url, timeout=timeout, headers=_conditional_headers(meta), stream=True)
+    if resp.status_code == 304:
+        if meta:
+            return resp
+        resp.close()
+        raise RuntimeError("服务器返回 304，但本地没有可用的缓存")
     try:
-        port_i = int(port)
+        resp.raise_for_status()
     except Exception:
-        return None
+        resp.close()
+        raise
+    return resp
 
-    return {
-        "name": name,
-        "type": "ss",
-        "server": server,
-        "port": port_i,
-        "cipher": method,
-        "password": password,
-    }
 
+def open_first_mirror(mirrors: Sequence[str], timeout: int = 15, cache_dir: Optional[str] = None) -> Tuple[str, Any]:
+    """Race ``mirrors`` and return ``(url, response)`` of the first successful reply.
 
-def parse_lines_to_proxies(lines: List[str], allow_native_ssr: bool = False) -> Tuple[List[Dict[str, Any]], List[str]]:
-    proxies: List[Dict[str, Any]] = []
-    warnings: List[str] = []
-    for line in lines:
-        line = line.strip()
-        if not line or line.startswith(("//", "#")):
-            continue
+    Mirrors are tried in order; each further one is fired after ``HttpPolicy.hedge_delay``
+    seconds, or at once when every request in flight has failed. Slower responses
+    that still arrive are closed without reading their bodies, and mirrors not yet
+    started are never contacted.
+    """
+    if requests is None:
+        raise RuntimeError("requests 未安装，请先安装依赖：pip install -r requirements.txt")
+    if len(mirrors) == 1:
+        url = mirrors[0]
+        _record_mirror(url, "attempt")
+        t0 = time.monotonic()
         try:
-            if line.startswith("ss://"):
-                p = parse_ss(line)
-            elif line.startswith("vmess://"):
-                p = parse_vmess(line)
-            elif line.startswith("trojan://"):
-                p = parse_trojan(line)
-            elif line.startswith("ssr://"):
-                p = parse_ssr(line, allow_native_ssr=allow_native_ssr)
-            else:
-                p = None
-            if p:
-                proxies.append(p)
-            else:
-                warnings.append(f"未识别或未支持的节点：{line[:80]}")
-        except Exception as e:
-            warnings.append(f"解析失败：{line[:80]} -> {e}")
-    return proxies, warnings
+            resp = _open_http(url, timeout, cache_dir)
+        except Exception:
+            _record_mirror(url, "failures")
+            raise
+        _record_mirror(url, "wins", time.monotonic() - t0)
+        return url, resp
 
+    cond = threading.Condition()
+    winner: List[Tuple[str, Any]] = []
+    errors: List[Exception] = []
+    running = 0
 
-def build_minimal_clash_yaml(proxies: List[Dict[str, Any]], profile_name: str) -> Dict[str, Any]:
-    proxy_names = [p.get("name", f"Proxy-{i}") for i, p in enumerate(proxies)]
-    config: Dict[str, Any] = {
-        "port": 7890,
-        "socks-port": 7891,
-        "allow-lan": True,
-        "mode": "Rule",
-        "log-level": "info",
-        "external-controller": "127.0.0.1:9090",
-        "proxies": proxies,
-        "proxy-groups": [
-            {
-                "name": "Proxy",
-                "type": "select",
-                "proxies": proxy_names + ["DIRECT", "REJECT"],
-            }
-        ],
-        "rules": [
-            "MATCH,Proxy",
-        ],
-    }
-    # Optional: add a name into a top-level comment via yaml's header unsupported; keep as is
-    return config
+    def attempt(url: str) -> None:
+        nonlocal running
+        t0 = time.monotonic()
+        try:
+            resp = _open_http(url, timeout, cache_dir)
+        except Exception as e:
+            _record_mirror(url, "failures")
+            with cond:
+                errors.append(e)
+                running -= 1
+                cond.notify_all()
+            return
+        elapsed = time.monotonic() - t0
+        with cond:
+            running -= 1
+            if not winner:
+                winner.append((url, resp))
+                _record_mirror(url, "wins", elapsed)
+                cond.notify_all()
+                return
+        resp.close()
+        _record_mirror(url, "losses", elapsed)
 
+    with cond:
+        for i, url in enumerate(mirrors):
+            running += 1
+            _record_mirror(url, "attempt")
+            # daemon threads: a loser stuck on a slow mirror must not hold up exit
+            threading.Thread(target=attempt, args=(url,), daemon=True).start()
+            if i == len(mirrors) - 1:
+                break
+            deadline = time.monotonic() + _HTTP_POLICY.hedge_delay
+            while not winner and running > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                cond.wait(remaining)
+            if winner:
+                break
+        while not winner and running > 0:
+            cond.wait()
+        if winner:
+            return winner[0]
+        raise errors[0]
 
-def write_yaml_to_file(config: Dict[str, Any], output_path: str) -> None:
-    if yaml is None:
-        raise RuntimeError("PyYAML 未安装，请先安装依赖：pip install -r requirements.txt")
-    # Ensure UTF-8 and avoid aliases
-    with open(output_path, "w", encoding="utf-8") as f:
-        yaml.safe_dump(config, f, sort_keys=False, allow_unicode=True)
 
+def fetch_subscription(source: Source, timeout: int = 15, cache_dir: Optional[str] = None) -> FetchResult:
+    """Fetch raw subscription bytes from URL or read local file.
+
+    With ``cache_dir`` set, HTTP(S) responses are cached by URL together with their
+    ETag / Last-Modified validators, and later fetches are sent as conditional
+    requests. A 304 reply returns the cached bytes with ``not_modified=True``.
+    ``source`` may list several mirror URLs, which are raced (``open_first_mirror``).
+    """
+    mirrors = source_mirrors(source)
+    # Local file
+    if len(mirrors) == 1 and is_local_source(mirrors[0]):
+        path = mirrors[0].replace("file://", "")
+        with open(path, "rb") as f:
+            return FetchResult(f.read(), url=mirrors[0])
 
-def run_once(url: str, output: str, name: str, allow_native_ssr: bool = False) -> int:
-    """Fetch, parse and write once. Return 0 on success, non-zero on failure."""
+    url, resp = open_first_mirror(mirrors, timeout=timeout, cache_dir=cache_dir)
+    if resp.status_code == 304:
+        resp.close()
+        cached = _load_fetch_cache(cache_dir, url) if cache_dir else None
+        if not cached:
+            raise RuntimeError("服务器返回 304，但本地没有可用的缓存")
+        return FetchResult(cached[1], not_modified=True, url=url)
     try:
-        text = fetch_subscription_text(url)
-    except Exception as e:
-        print(f"拉取订阅失败: {e}", file=sys.stderr)
-        return 2
+        raw = resp.content
+    finally:
+        resp.close()
+    if cache_dir:
+        _save_fetch_cache(cache_dir, url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), raw)
+    return FetchResult(raw, url=url)
 
-    lines = split_lines_keep_schemes(text)
-    proxies, warnings = parse_lines_to_proxies(lines, allow_native_ssr=allow_native_ssr)
 
-    if not proxies:
-        print("未能解析到任何有效节点。", file=sys.stderr)
-        if warnings:
-            for w in warnings[:10]:
-                print(f"提示: {w}", file=sys.stderr)
-        return 3
+def fetch_subscription_text(url_or_path: str, timeout: int = 15) -> str:
+    """Fetch subscription text from URL or read local file. Returns raw text.
 
-    config = build_minimal_clash_yaml(proxies, name)
+    If the result appears to be base64 of lines of scheme URLs, decode it.
+    """
+    return fetch_subscription(url_or_path, timeout=timeout).text
 
-    try:
-        write_yaml_to_file(config, output)
-    except Exception as e:
-        print(f"写入 YAML 失败: {e}", file=sys.stderr)
-        return 4
 
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 已生成 Clash 配置: {output}，共 {len(proxies)} 个节点。")
-    if warnings:
-        print(f"注意：有 {len(warnings)} 条警告/未支持节点，前几条：")
-        for w in warnings[:10]:
-            print(f"- {w}")
-    return 0
+def _source_host(source: Source) -> str:
+    url_or_path = source_mirrors(source)[0]
+    return "" if is_local_source(url_or_path) else (urlsplit(url_or_path).hostname or "")
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(
-        description="将通用订阅（ss/vmess/trojan/ssr）转换为 Clash 兼容的 YAML 配置"
+async def fetch_many_async(
+    urls: Sequence[Source],
+    timeout: int = 15,
+    cache_dir: Optional[str] = None,
+    per_host_limit: int = 2,
+) -> List[Union[FetchResult, BaseException]]:
+    """Fetch several sources concurrently, at most ``per_host_limit`` at a time per host.
+
+    Blocking fetches run in a thread pool; results (or the exception raised for that
+    source) come back in the order of ``urls``.
+    """
+    loop = asyncio.get_running_loop()
+    limits: Dict[str, asyncio.Semaphore] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(32, len(urls)))) as pool:
+
+        async def fetch_one(url: Source) -> FetchResult:
+            limit = limits.setdefault(_source_host(url), asyncio.Semaphore(max(1, per_host_limit)))
+            async with limit:
+                return await loop.run_in_executor(pool, partial(fetch_subscription, url, timeout, cache_dir))
+
+        return await asyncio.gather(*(fetch_one(u) for u in urls), return_exceptions=True)
+
+
+def fetch_many(
+    urls: Sequence[Source],
+    timeout: int = 15,
+    cache_dir: Optional[str] = None,
+    per_host_limit: int = 2,
+) -> List[Union[FetchResult, BaseException]]:
+    """Synchronous wrapper around ``fetch_many_async``; a single source is fetched inline."""
+    if len(urls) == 1:
+        try:
+            return [fetch_subscription(urls[0], timeout=timeout, cache_dir=cache_dir)]
+        except Exception as e:
+            return [e]
+    return asyncio.run(fetch_many_async(urls, timeout=timeout, cache_dir=cache_dir, per_host_limit=per_host_limit))
+
+
+def read_sources_file(path: str) -> List[Source]:
+    """One subscription per line; blank lines and ``#`` comments are ignored.
+
+    A line is a local path or URL; several whitespace-separated http(s) URLs on one
+    line are mirrors of the same subscription.
+    """
+    sources: List[Source] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split()
+            if len(parts) > 1 and all(re.match(r"^https?://", p) for p in parts):
+                sources.append(parts)
+            else:
+                sources.append(line)
+    return sources
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class FetchStream:
+    """Streaming counterpart of ``FetchResult``: raw subscription bytes as chunks."""
+
+    chunks: Iterator[bytes]
+    not_modified: bool = False
+    url: str = ""
+    # the open HTTP response behind ``chunks``, if any
+    response: Any = None
+
+    def close(self) -> None:
+        """Release the body's file or connection, whether or not ``chunks`` was read."""
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+        if self.response is not None:
+            self.response.close()
+
+
+def _iter_file_chunks(path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _iter_response_chunks(resp: Any, cache_dir: Optional[str], url: str) -> Iterator[bytes]:
+    """Yield the response body, teeing it into the fetch cache when it has validators."""
+    etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    tee = None
+    body_path = tee_path = ""
+    if cache_dir and (etag or last_modified):
+        body_path = _fetch_cache_paths(cache_dir, url)[1]
+        try:
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            fd, tee_path = _cache_temp_file(body_path)
+            tee = os.fdopen(fd, "wb")
+        except OSError:
+            tee = None
+    elif cache_dir:
+        forget_fetch_cache(cache_dir, url)
+    try:
+        for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            if tee is not None:
+                tee.write(chunk)
+            yield chunk
+        if tee is not None and cache_dir:
+            tee.close()
+            os.replace(tee_path, body_path)
+            tee = None
+            _write_fetch_meta(cache_dir, url, etag, last_modified)
+    finally:
+        if tee is not None:
+            # the body was cut short (or the cache write failed): drop the partial copy
+            tee.close()
+            _discard(tee_path)
+        resp.close()
+
+
+def stream_subscription(source: Source, timeout: int = 15, cache_dir: Optional[str] = None) -> FetchStream:
+    """Like ``fetch_subscription`` but without holding the body in memory."""
+    mirrors = source_mirrors(source)
+    if len(mirrors) == 1 and is_local_source(mirrors[0]):
+        return FetchStream(_iter_file_chunks(mirrors[0].replace("file://", "")), url=mirrors[0])
+
+    url, resp = open_first_mirror(mirrors, timeout=timeout, cache_dir=cache_dir)
+    if resp.status_code == 304:
+        resp.close()
+        if not cache_dir:
+            raise RuntimeError("服务器返回 304，但本地没有可用的缓存")
+        return FetchStream(_iter_file_chunks(_fetch_cache_paths(cache_dir, url)[1]), not_modified=True, url=url)
+    return FetchStream(_iter_response_chunks(resp, cache_dir, url), url=url, response=resp)
+
+
+_B64_NOISE = re.compile(rb"[^A-Za-z0-9+/_-]")
+
+
+def _iter_b64decode(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Incremental, forgiving Base64 decoding (see ``b64decode_to_text``)."""
+    pending = b""
+    for chunk in chunks:
+        pending += _B64_NOISE.sub(b"", chunk)
+        cut = len(pending) - len(pending) % 4
+        if cut:
+            yield base64.urlsafe_b64decode(pending[:cut])
+            pending = pending[cut:]
+    if len(pending) > 1:
+        yield base64.urlsafe_b64decode(pending + b"=" * (-len(pending) % 4))
+
+
+def iter_subscription_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Streaming counterpart of ``decode_subscription_bytes`` + ``split_lines_keep_schemes``.
+
+    Whether the body is Base64 is decided from its first few KiB.
+    """
+    it = iter(chunks)
+    head = b""
+    for chunk in it:
+        head += chunk
+        if len(head) >= 4096:
+            break
+    body: Iterable[bytes] = itertools.chain([head], it)
+    if b"://" not in head:
+        body = _iter_b64decode(body)
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    buf = ""
+    for chunk in body:
+        buf += decoder.decode(chunk)
+        lines = buf.split("\n")
+        buf = lines.pop()
+        for line in lines:
+            yield from _split_line(line)
+    buf += decoder.decode(b"", final=True)
+    yield from _split_line(buf)
+
+
+def _split_line(line: str) -> List[str]:
+    line = line.strip()
+    if not line:
+        return []
+    if line.count("://") > 1 and not line.startswith("ssr://") and not line.startswith("vmess://"):
+        # split by spaces
+        return line.split()
+    return [line]
+
+
+def split_lines_keep_schemes(text: str) -> List[str]:
+    # providers may join by newlines or return a single line with many entries
+    # Split on newlines (a CR left by CRLF is stripped per line), and filter empty
+    lines = text.split("\n")
+    # Some providers concatenate with multiple spaces; split further
+    result: List[str] = []
+    for line in lines:
+        result.extend(_split_line(line))
+    return result
+
+
+class Proxy:
+    """A parsed node. Subclasses hold one protocol each in ``__slots__``.
+
+    Hundreds of thousands of these can be alive at once, so they avoid per-node
+    dicts; ``to_clash`` builds the Clash mapping only when the config is emitted.
+    """
+
+    __slots__ = ("name", "server", "port")
+    type = ""
+
+    def __init__(self, name: str, server: str, port: int) -> None:
+        self.name = name
+        self.server = server
+        self.port = port
+
+    def to_clash(self) -> Dict[str, Any]:
+        return {"name": self.name, "type": self.type, "server": self.server, "port": self.port}
+
+    def identity(self) -> Tuple[Any, ...]:
+        """What makes two nodes the same endpoint, whatever they are called."""
+        return (self.type, str(self.server).lower(), self.port)
+
+    def _fields(self) -> Dict[str, Any]:
+        return {slot: getattr(self, slot) for cls in type(self).__mro__ for slot in getattr(cls, "__slots__", ())}
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) is type(other) and self._fields() == other._fields()  # type: ignore[attr-defined]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self._fields().items())})"
+
+
+class SSProxy(Proxy):
+    __slots__ = ("cipher", "password", "plugin")
+    type = "ss"
+
+    def __init__(
+        self, name: str, server: str, port: int, cipher: str, password: str, plugin: Optional[str] = None
+    ) -> None:
+        super().__init__(name, server, port)
+        self.cipher = cipher
+        self.password = password
+        self.plugin = plugin
+
+    def to_clash(self) -> Dict[str, Any]:
+        out = super().to_clash()
+        out["cipher"] = self.cipher
+        out["password"] = self.password
+        if self.plugin:
+            out["plugin"] = self.plugin
+        return out
+
+    def identity(self) -> Tuple[Any, ...]:
+        return super().identity() + (self.cipher, self.password, self.plugin)
+
+
+class SSRProxy(Proxy):
+    __slots__ = ("cipher", "password", "protocol", "obfs", "obfs_param", "protocol_param")
+    type = "ssr"
+
+    def __init__(
+        self,
+        name: str,
+        server: str,
+        port: int,
+        cipher: str,
+        password: str,
+        protocol: str,
+        obfs: str,
+        obfs_param: str = "",
+        protocol_param: str = "",
+    ) -> None:
+        super().__init__(name, server, port)
+        self.cipher = cipher
+        self.password = password
+        self.protocol = protocol
+        self.obfs = obfs
+        self.obfs_param = obfs_param
+        self.protocol_param = protocol_param
+
+    def to_clash(self) -> Dict[str, Any]:
+        out = super().to_clash()
+        out["cipher"] = self.cipher
+        out["password"] = self.password
+        out["protocol"] = self.protocol
+        out["obfs"] = self.obfs
+        out["udp"] = True
+        if self.obfs_param:
+            out["obfs-param"] = self.obfs_param
+        if self.protocol_param:
+            out["protocol-param"] = self.protocol_param
+        return out
+
+    def identity(self) -> Tuple[Any, ...]:
+        return super().identity() + (
+            self.cipher,
+            self.password,
+            self.protocol,
+            self.obfs,
+            self.obfs_param,
+            self.protocol_param,
+        )
+
+
+class VmessProxy(Proxy):
+    __slots__ = ("uuid", "alter_id", "tls", "servername", "alpn", "network", "ws_path", "ws_host", "grpc_service")
+    type = "vmess"
+
+    def __init__(
+        self,
+        name: str,
+        server: str,
+        port: int,
+        uuid: str,
+        alter_id: int = 0,
+        tls: bool = False,
+        servername: Optional[str] = None,
+        alpn: Optional[List[str]] = None,
+        network: Optional[str] = None,
+        ws_path: str = "/",
+        ws_host: Optional[str] = None,
+        grpc_service: Optional[str] = None,
+    ) -> None:
+        super().__init__(name, server, port)
+        self.uuid = uuid
+        self.alter_id = alter_id
+        self.tls = tls
+        self.servername = servername
+        self.alpn = alpn
+        self.network = network
+        self.ws_path = ws_path
+        self.ws_host = ws_host
+        self.grpc_service = grpc_service
+
+    def to_clash(self) -> Dict[str, Any]:
+        out = super().to_clash()
+        out["uuid"] = self.uuid
+        out["alterId"] = self.alter_id
+        out["cipher"] = "auto"
+        if self.tls:
+            out["tls"] = True
+        if self.servername:
+            out["servername"] = self.servername
+        if self.alpn:
+            out["alpn"] = self.alpn
+        if self.network == "ws":
+            out["network"] = "ws"
+            ws_opts: Dict[str, Any] = {"path": self.ws_path}
+            if self.ws_host:
+                ws_opts["headers"] = {"Host": self.ws_host}
+            out["ws-opts"] = ws_opts
+        elif self.network == "grpc":
+            out["network"] = "grpc"
+            if self.grpc_service is not None:
+                out["grpc-opts"] = {"grpc-service-name": self.grpc_service}
+        return out
+
+    def identity(self) -> Tuple[Any, ...]:
+        return super().identity() + (self.uuid, self.tls, self.servername) + _transport_identity(self)
+
+
+class TrojanProxy(Proxy):
+    __slots__ = ("password", "sni", "alpn", "network", "ws_path", "ws_host", "grpc_service")
+    type = "trojan"
+
+    def __init__(
+        self,
+        name: str,
+        server: str,
+        port: int,
+        password: str,
+        sni: Optional[str] = None,
+        alpn: Optional[List[str]] = None,
+        network: Optional[str] = None,
+        ws_path: Optional[str] = None,
+        ws_host: Optional[str] = None,
+        grpc_service: Optional[str] = None,
+    ) -> None:
+        super().__init__(name, server, port)
+        self.password = password
+        self.sni = sni
+        self.alpn = alpn
+        self.network = network
+        self.ws_path = ws_path
+        self.ws_host = ws_host
+        self.grpc_service = grpc_service
+
+    def to_clash(self) -> Dict[str, Any]:
+        out = super().to_clash()
+        out["password"] = self.password
+        out["udp"] = True
+        out["sni"] = self.sni
+        out["skip-cert-verify"] = False
+        if self.alpn:
+            out["alpn"] = self.alpn
+        if self.network == "ws":
+            out["network"] = "ws"
+            ws_opts: Dict[str, Any] = {}
+            if self.ws_path:
+                ws_opts["path"] = self.ws_path
+            if self.ws_host:
+                ws_opts["headers"] = {"Host": self.ws_host}
+            if ws_opts:
+                out["ws-opts"] = ws_opts
+        elif self.network == "grpc":
+            out["network"] = "grpc"
+            if self.grpc_service:
+                out["grpc-opts"] = {"grpc-service-name": self.grpc_service}
+        return out
+
+    def identity(self) -> Tuple[Any, ...]:
+        return super().identity() + (self.password, self.sni) + _transport_identity(self)
+
+
+class MappingProxy(Proxy):
+    """A node handed over as a ready Clash mapping, e.g. by a parser plugin."""
+
+    __slots__ = ("mapping",)
+
+    def __init__(self, mapping: Dict[str, Any]) -> None:
+        super().__init__(mapping.get("name"), mapping.get("server"), mapping.get("port"))
+        self.mapping = mapping
+
+    @property
+    def type(self) -> str:  # type: ignore[override]
+        return self.mapping.get("type") or ""
+
+    def to_clash(self) -> Dict[str, Any]:
+        out = dict(self.mapping)
+        if self.name is not None:
+            out["name"] = self.name
+        return out
+
+    def identity(self) -> Tuple[Any, ...]:
+        rest = {k: v for k, v in self.mapping.items() if k != "name"}
+        return super().identity() + (json.dumps(rest, sort_keys=True, default=str),)
+
+
+def _transport_identity(proxy: Union["VmessProxy", "TrojanProxy"]) -> Tuple[Any, ...]:
+    if proxy.network == "ws":
+        return ("ws", proxy.ws_path, proxy.ws_host)
+    if proxy.network == "grpc":
+        return ("grpc", proxy.grpc_service)
+    return ("tcp",)
+
+
+DEDUPE_POLICIES = ("first", "last", "shortest", "longest", "off")
+
+
+def dedupe_proxies(proxies: Iterable[Proxy], policy: str = "first") -> Tuple[List[Proxy], int]:
+    """Collapse nodes with the same ``identity()`` in one pass; return ``(kept, collapsed)``.
+
+    A survivor keeps the position of its first occurrence. ``policy`` picks the
+    name it ends up with: the first or last one seen, or the shortest or longest
+    (ties keep the earlier name). ``off`` keeps every node.
+    """
+    if policy not in DEDUPE_POLICIES:
+        raise ValueError(f"unknown dedupe policy: {policy}")
+    if policy == "off":
+        return list(proxies), 0
+    index: Dict[Tuple[Any, ...], Proxy] = {}
+    kept: List[Proxy] = []
+    collapsed = 0
+    for p in proxies:
+        key = p.identity()
+        first = index.get(key)
+        if first is None:
+            index[key] = p
+            kept.append(p)
+            continue
+        collapsed += 1
+        if (
+            policy == "last"
+            or (policy == "shortest" and len(p.name or "") < len(first.name or ""))
+            or (policy == "longest" and len(p.name or "") > len(first.name or ""))
+        ):
+            first.name = p.name
+    return kept, collapsed
+
+
+def identity_digest(proxy: Proxy) -> bytes:
+    """16-byte digest of ``proxy.identity()``, for remembering seen nodes cheaply while streaming."""
+    return hashlib.blake2b(repr(proxy.identity()).encode("utf-8"), digest_size=16).digest()
+
+
+# built-in policies and our own group; Clash rejects a proxy that shares a name with them
+RESERVED_PROXY_NAMES = ("DIRECT", "REJECT", "Proxy")
+
+
+class UniqueNames:
+    """Hands out proxy names that are unique within one config.
+
+    A name seen before becomes ``name 2``, ``name 3``, ... in order of arrival.
+    The next free suffix is remembered per base name, so thousands of nodes all
+    called "SS" cost O(1) each instead of rescanning the taken suffixes.
+    """
+
+    def __init__(self, reserved: Iterable[str] = RESERVED_PROXY_NAMES) -> None:
+        self.used = set(reserved)
+        self.renamed = 0
+        self._next_suffix: Dict[str, int] = {}
+
+    def claim(self, name: str) -> str:
+        if name not in self.used:
+            self.used.add(name)
+            return name
+        n = self._next_suffix.get(name, 2)
+        candidate = f"{name} {n}"
+        while candidate in self.used:
+            n += 1
+            candidate = f"{name} {n}"
+        self._next_suffix[name] = n + 1
+        self.used.add(candidate)
+        self.renamed += 1
+        return candidate
+
+
+def ensure_unique_names(proxies: Sequence[Proxy], reserved: Iterable[str] = RESERVED_PROXY_NAMES) -> int:
+    """Rename ``proxies`` in place so no two share a name; return how many were renamed."""
+    names = UniqueNames(reserved)
+    for i, p in enumerate(proxies):
+        p.name = names.claim(_proxy_name(p, i))
+    return names.renamed
+
+
+# schemes whose parser names the node after the URL fragment, so a filter can decide before parsing
+_FRAGMENT_NAMED_SCHEMES = frozenset(("ss", "trojan"))
+_LEADING_FLAGS = re.compile(r"(?:\(\?[aiLmsux]+\))+")
+
+
+def _keywords_regex(words: Iterable[str]) -> str:
+    """One regex for a set of literal keywords, with shared prefixes factored into a trie.
+
+    Only whether some keyword occurs matters, so a keyword that is a prefix of
+    another one ends its branch.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: Dict[str, Any]) -> str:
+        if "" in node:
+            return ""
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return emit(trie)
+
+
+def compile_name_patterns(patterns: Iterable[str]) -> List["re.Pattern[str]"]:
+    """Compile keywords and regexes into as few patterns as possible; a name matches if any does.
+
+    Plain keywords go into one trie-shaped branch; anything with regex syntax is
+    added as its own alternative (leading flags such as ``(?i)`` apply to that
+    pattern only), and a pattern that does not compile is taken literally. A regex
+    with capturing groups, or one that cannot be scoped that way, is compiled on
+    its own instead: inside a shared alternation its group numbers would shift and
+    its backreferences (or a group name used twice) would break.
+    """
+    keywords: List[str] = []
+    regexes: List[str] = []
+    standalone: List["re.Pattern[str]"] = []
+    for pattern in patterns:
+        if not pattern:
+            continue
+        if re.escape(pattern) == pattern:
+            keywords.append(pattern)
+            continue
+        try:
+            compiled = re.compile(pattern)
+        except re.error:
+            keywords.append(pattern)
+            continue
+        if compiled.groups:
+            standalone.append(compiled)
+            continue
+        m = _LEADING_FLAGS.match(pattern)
+        if m:
+            flags = "".join(dict.fromkeys(ch for ch in m.group() if ch not in "(?)"))
+            body = pattern[m.end():]
+            if "x" in flags:
+                # a trailing "# comment" would otherwise swallow the closing parenthesis
+                body += "\n"
+            wrapped = f"(?{flags}:{body})"
+        else:
+            wrapped = f"(?:{pattern})"
+        try:
+            re.compile(wrapped)
+        except re.error:
+            standalone.append(compiled)
+            continue
+        regexes.append(wrapped)
+    if keywords:
+        regexes.insert(0, _keywords_regex(keywords))
+    if not regexes:
+        return standalone
+    try:
+        return [re.compile("|".join(regexes))] + standalone
+    except re.error:
+        return [re.compile(regex) for regex in regexes] + standalone
+
+
+class NameFilter:
+    """Keeps nodes whose name matches an ``include`` pattern (if any) and no ``exclude`` pattern.
+
+    Each side is usually one compiled pattern, so a name is scanned once per side
+    however many patterns were given (regexes with capturing groups get their own,
+    see ``compile_name_patterns``). ``rejected`` counts the nodes dropped so far.
+    """
+
+    def __init__(self, include: Iterable[str] = (), exclude: Iterable[str] = ()) -> None:
+        self.include = compile_name_patterns(include)
+        self.exclude = compile_name_patterns(exclude)
+        self.rejected = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.include or self.exclude)
+
+    def accepts(self, name: Optional[str]) -> bool:
+        name = name or ""
+        if (self.include and not any(p.search(name) for p in self.include)) or any(
+            p.search(name) for p in self.exclude
+        ):
+            self.rejected += 1
+            return False
+        return True
+
+    def rejects_line(self, line: str) -> bool:
+        """True if ``line`` can be dropped on the name in its fragment, without parsing it."""
+        if line_scheme(line) not in _FRAGMENT_NAMED_SCHEMES:
+            return False
+        name = parse_name_from_fragment(line)
+        return bool(name) and not self.accepts(name)
+
+
+def percent_decode(s: str) -> str:
+    if "%" not in s:
+        return s
+    try:
+        return unquote(s)
+    except Exception:
+        return s
+
+
+def parse_name_from_fragment(url: str) -> Optional[str]:
+    if "#" in url:
+        return percent_decode(url.split("#", 1)[1]) or None
+    return None
+
+
+def parse_query(url: str) -> Dict[str, str]:
+    if "?" not in url:
+        # most share links carry no query at all; skip urlparse for them
+        return {}
+    q = urlparse(url).query
+    out: Dict[str, str] = {}
+    if not q:
+        return out
+    pairs = parse_qs(q)
+    for k, v in pairs.items():
+        if not v:
+            continue
+        out[k] = v[0]
+    return out
+
+
+def _parse_port(port_str: str) -> int:
+    # tolerate junk such as a trailing "/" or query; only the digits count
+    if port_str.isdecimal() and port_str.isascii():
+        return int(port_str)
+    return int(_NON_DIGITS_RE.sub("", port_str))
+
+
+def parse_ss(url: str) -> Optional[SSProxy]:
+    # ss://[base64(method:password@host:port)] or ss://method:password@host:port?plugin=...#name
+    assert url.startswith("ss://")
+    body = url[len("ss://") :]
+    name = parse_name_from_fragment(url) or "SS"
+    # remove fragment and query from body for core parsing
+    body_clean = body.split("#", 1)[0]
+    query = parse_query(url)
+
+    # If contains '@' it is non-encoded userinfo
+    parsed: Optional[Tuple[str, str, str, int]] = None
+    candidate = body_clean
+    if candidate.startswith("-"):
+        # e.g., clash-format lines. Not typical here; skip
+        return None
+    try:
+        if "@" not in candidate:
+            # base64 userinfo@server
+            decoded = b64decode_to_text(candidate.split("?", 1)[0])
+            candidate2 = decoded
+        else:
+            candidate2 = candidate
+        # method:password@host:port
+        if "@" not in candidate2:
+            return None
+        userinfo, server = candidate2.split("@", 1)
+        method, password = userinfo.split(":", 1)
+        if ":" not in server:
+            return None
+        host, port_str = server.rsplit(":", 1)
+        port = _parse_port(port_str)
+        parsed = (method, password, host, port)
+    except Exception:
+        parsed = None
+
+    if not parsed:
+        return None
+
+    method, password, host, port = parsed
+    # plugin support (simple); plugin-opts not parsed here, many clients accept just plugin
+    return SSProxy(name, host, port, method, password, plugin=query.get("plugin"))
+
+
+def parse_vmess(url: str) -> Optional[VmessProxy]:
+    assert url.startswith("vmess://")
+    body = url[len("vmess://") :]
+    try:
+        data = json.loads(b64decode_to_text(body))
+    except Exception:
+        return None
+    name = data.get("ps") or "VMess"
+    server = data.get("add")
+    port = int(str(data.get("port") or 0) or 0)
+    uuid = data.get("id")
+    aid = int(str(data.get("aid") or 0) or 0)
+    net = data.get("net") or "tcp"
+    tls_flag = (data.get("tls") or "").lower() in ("tls", "reality")
+    sni = data.get("sni") or data.get("peer") or None
+    host = data.get("host") or data.get("sni") or None
+    path = data.get("path") or "/"
+    alpn = data.get("alpn")
+
+    if not server or not port or not uuid:
+        return None
+
+    # clash expects alpn as a list
+    alpn_list: Optional[List[str]] = None
+    if alpn:
+        if isinstance(alpn, str):
+            alpn_list = [alpn]
+        elif isinstance(alpn, list):
+            alpn_list = alpn
+
+    network = (net or "tcp").lower()
+    return VmessProxy(
+        name,
+        server,
+        port,
+        uuid,
+        alter_id=aid,
+        tls=tls_flag,
+        servername=sni,
+        alpn=alpn_list,
+        network=network,
+        ws_path=path or "/",
+        ws_host=host,
+        grpc_service=path.strip("/") if network == "grpc" and path else None,
+    )
+
+
+def parse_trojan(url: str) -> Optional[TrojanProxy]:
+    assert url.startswith("trojan://")
+    name = parse_name_from_fragment(url) or "Trojan"
+    query = parse_query(url)
+    body = url[len("trojan://") :].split("#", 1)[0]
+    # password@host:port
+    try:
+        if "@" not in body:
+            return None
+        password, server_part = body.split("@", 1)
+        if ":" not in server_part:
+            return None
+        host, port_str = server_part.rsplit(":", 1)
+        port = _parse_port(port_str)
+    except Exception:
+        return None
+    alpn = query.get("alpn")
+    # Basic ws/grpc support if present
+    type_q = (query.get("type") or query.get("transport") or "").lower()
+    return TrojanProxy(
+        name,
+        host,
+        port,
+        percent_decode(password),
+        sni=query.get("sni") or query.get("peer") or host,
+        alpn=alpn.split(",") if alpn else None,
+        network=type_q,
+        ws_path=query.get("path"),
+        ws_host=query.get("host") or query.get("sni"),
+        grpc_service=query.get("serviceName") or query.get("service"),
+    )
+
+
+def parse_ssr(url: str, allow_native_ssr: bool = False) -> Optional[Proxy]:
+    # Convert SSR only if protocol=origin and obfs=plain -> as SS
+    assert url.startswith("ssr://")
+    body = url[len("ssr://") :]
+    try:
+        decoded = b64decode_to_text(body)
+    except Exception:
+        return None
+    # server:port:protocol:method:obfs:base64pass/?params
+    try:
+        main, _, params = decoded.partition("/")
+        server, port, protocol, method, obfs, pwd_b64 = main.split(":", 5)
+        password = b64decode_to_text(pwd_b64)
+        # remarks
+        name = "SSR"
+        if params.startswith("?"):
+            params_qs = params[1:]
+            pairs = dict(
+                (k, v) for k, _, v in [p.partition("=") for p in params_qs.split("&") if p]
+            )
+            if "remarks" in pairs:
+                name = b64decode_to_text(pairs.get("remarks", "")) or name
+            obfsparam = b64decode_to_text(pairs.get("obfsparam", "")) if "obfsparam" in pairs else ""
+            protoparam = b64decode_to_text(pairs.get("protoparam", "")) if "protoparam" in pairs else ""
+    except Exception:
+        return None
+
+    if allow_native_ssr:
+        # Output Clash Meta native SSR format
+        try:
+            port_i = int(port)
+        except Exception:
+            return None
+        return SSRProxy(
+            name,
+            server,
+            port_i,
+            method,
+            password,
+            protocol,
+            obfs,
+            obfs_param=obfsparam if 'obfsparam' in locals() else "",
+            protocol_param=protoparam if 'protoparam' in locals() else "",
+        )
+
+    if protocol != "origin" or obfs != "plain":
+        return None  # Cannot safely convert to Clash SS
+
+    try:
+        port_i = int(port)
+    except Exception:
+        return None
+
+    return SSProxy(name, server, port_i, method, password)
+
+
+ParserFunc = Callable[[str, bool], Union[Proxy, Dict[str, Any], None]]
+
+# scheme (the text before "://") -> parser, called with the stripped line and ``allow_native_ssr``
+PARSERS: Dict[str, ParserFunc] = {
+    "ss": lambda line, allow_native_ssr: parse_ss(line),
+    "vmess": lambda line, allow_native_ssr: parse_vmess(line),
+    "trojan": lambda line, allow_native_ssr: parse_trojan(line),
+    "ssr": lambda line, allow_native_ssr: parse_ssr(line, allow_native_ssr=allow_native_ssr),
+}
+_BUILTIN_PARSERS = dict(PARSERS)
+
+PARSER_ENTRY_POINT_GROUP = "sub2clash.parsers"
+_PARSER_PLUGINS_LOADED = False
+
+
+def register_parser(scheme: str, func: ParserFunc) -> None:
+    """Route ``<scheme>://`` lines to ``func``, replacing any parser already registered for it."""
+    PARSERS[scheme] = func
+
+
+def load_parser_plugins() -> List[str]:
+    """Register parsers advertised under the ``sub2clash.parsers`` entry-point group, once.
+
+    Each entry point is named after its scheme and points at a ``ParserFunc``, which
+    may return a ``Proxy`` or a plain Clash mapping, e.g.
+    ``vless = mypkg.parsers:parse_vless``. Returns the schemes that were registered.
+    """
+    global _PARSER_PLUGINS_LOADED
+    if _PARSER_PLUGINS_LOADED:
+        return []
+    _PARSER_PLUGINS_LOADED = True
+    try:
+        eps = entry_points(group=PARSER_ENTRY_POINT_GROUP)
+    except TypeError:
+        # Python < 3.10
+        eps = entry_points().get(PARSER_ENTRY_POINT_GROUP, [])
+    loaded: List[str] = []
+    for ep in eps:
+        try:
+            register_parser(ep.name, ep.load())
+        except Exception as e:
+            print(f"加载解析插件 {ep.name} 失败: {e}", file=sys.stderr)
+            continue
+        loaded.append(ep.name)
+    return loaded
+
+
+def line_scheme(line: str) -> str:
+    i = line.find("://")
+    return line[:i] if i > 0 else ""
+
+
+def parse_line(line: str, allow_native_ssr: bool = False) -> Optional[Proxy]:
+    """Parse a single stripped subscription line; None if the scheme is unsupported or invalid."""
+    if not _PARSER_PLUGINS_LOADED:
+        load_parser_plugins()
+    parser = PARSERS.get(line_scheme(line))
+    if parser is None:
+        return None
+    proxy = parser(line, allow_native_ssr)
+    if isinstance(proxy, dict):
+        proxy = MappingProxy(proxy) if proxy else None
+    return proxy
+
+
+@dataclass
+class SchemeStats:
+    """Per-scheme parse outcomes; ``failed`` includes lines whose scheme has no parser."""
+
+    parsed: int = 0
+    failed: int = 0
+
+
+SCHEME_STATS: Dict[str, SchemeStats] = {}
+_SCHEME_STATS_LOCK = threading.Lock()
+
+
+def scheme_stats() -> Dict[str, SchemeStats]:
+    """Snapshot of parse outcomes per scheme for every line parsed so far."""
+    with _SCHEME_STATS_LOCK:
+        return {scheme: SchemeStats(**st.__dict__) for scheme, st in SCHEME_STATS.items()}
+
+
+def _tally_schemes(stats: Dict[str, SchemeStats], counts: Dict[Tuple[str, bool], int]) -> None:
+    for (scheme, ok), n in counts.items():
+        st = stats.setdefault(scheme, SchemeStats())
+        if ok:
+            st.parsed += n
+        else:
+            st.failed += n
+
+
+def _record_schemes(counts: Dict[Tuple[str, bool], int], schemes: Optional[Dict[str, SchemeStats]] = None) -> None:
+    """Fold ``counts`` into ``SCHEME_STATS`` and, if given, into the caller's own ``schemes``."""
+    with _SCHEME_STATS_LOCK:
+        _tally_schemes(SCHEME_STATS, counts)
+    if schemes is not None:
+        _tally_schemes(schemes, counts)
+
+
+class ParseCache:
+    """Bounded LRU memo of parsed lines, persisted to disk between runs.
+
+    Keys are a hash of the line plus the ``allow_native_ssr`` flag; values are the
+    pickled proxies, so every hit hands out a fresh copy. Only successful
+    parses are stored, and a file written by another version of this script is
+    ignored. All methods are safe to call from several threads.
+    """
+
+    VERSION = 3
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 50000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(line: str, allow_native_ssr: bool) -> bytes:
+        return hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest() + (b"\1" if allow_native_ssr else b"\0")
+
+    def get(self, line: str, allow_native_ssr: bool = False) -> Optional[Proxy]:
+        key = self._key(line, allow_native_ssr)
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            return pickle.loads(blob)
+        except Exception:
+            # damaged, or pickled by classes that have since changed: parse afresh
+            with self._lock:
+                if self._entries.get(key) is blob:
+                    del self._entries[key]
+                    self._dirty = True
+                self.hits -= 1
+                self.misses += 1
+            return None
+
+    def put(self, line: str, allow_native_ssr: bool, proxy: Proxy) -> None:
+        if self.max_entries <= 0:
+            return
+        key = self._key(line, allow_native_ssr)
+        blob = pickle.dumps(proxy, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = blob
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                version, fingerprint, entries = pickle.load(f)
+        except Exception:
+            # missing, truncated or from another version: start empty
+            return
+        if version != self.VERSION or fingerprint != _code_fingerprint() or not isinstance(entries, OrderedDict):
+            return
+        self._entries = entries
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._lock:
+                with open(self.path + ".tmp", "wb") as f:
+                    pickle.dump((self.VERSION, _code_fingerprint(), self._entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(self.path + ".tmp", self.path)
+                self._dirty = False
+        except OSError:
+            pass
+
+
+_PARSE_CACHES: Dict[str, ParseCache] = {}
+_PARSE_CACHES_LOCK = threading.Lock()
+
+
+def get_parse_cache(cache_dir: str, max_entries: int = 50000) -> ParseCache:
+    """Return the process-wide parse cache for ``cache_dir``, loading it from disk once."""
+    path = os.path.join(cache_dir, "parse-cache.pickle")
+    with _PARSE_CACHES_LOCK:
+        cache = _PARSE_CACHES.get(path)
+        if cache is None:
+            cache = _PARSE_CACHES[path] = ParseCache(path, max_entries)
+        else:
+            cache.max_entries = max_entries
+    return cache
+
+
+def _iter_entries(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith(("//", "#")):
+            yield line
+
+
+def iter_parsed_lines(
+    lines: Iterable[str],
+    allow_native_ssr: bool = False,
+    cache: Optional[ParseCache] = None,
+    schemes: Optional[Dict[str, SchemeStats]] = None,
+) -> Iterator[Tuple[Optional[Proxy], Optional[str]]]:
+    """Lazily parse ``lines``, yielding ``(proxy, None)`` or ``(None, warning)`` per entry.
+
+    Outcomes per scheme are added to ``scheme_stats()`` and, if given, to ``schemes``.
+    """
+    # tallied locally and folded into SCHEME_STATS once, to keep locking off the per-line path
+    counts: Dict[Tuple[str, bool], int] = {}
+    try:
+        for line in _iter_entries(lines):
+            result = _parse_entry(line, allow_native_ssr, cache)
+            key = (line_scheme(line), result[0] is not None)
+            counts[key] = counts.get(key, 0) + 1
+            yield result
+    finally:
+        _record_schemes(counts, schemes)
+
+
+def _parse_entry(
+    line: str, allow_native_ssr: bool, cache: Optional[ParseCache] = None
+) -> Tuple[Optional[Proxy], Optional[str]]:
+    try:
+        p = cache.get(line, allow_native_ssr) if cache is not None else None
+        if p is None:
+            p = parse_line(line, allow_native_ssr=allow_native_ssr)
+            if p and cache is not None:
+                cache.put(line, allow_native_ssr, p)
+        if p:
+            return p, None
+        return None, f"未识别或未支持的节点：{line[:80]}"
+    except Exception as e:
+        return None, f"解析失败：{line[:80]} -> {e}"
+
+
+# below this many entries a process pool costs more to start than it saves
+PARALLEL_PARSE_MIN_LINES = 20000
+PARSE_CHUNK_LINES = 5000
+
+_PARSE_POOL: Optional[ProcessPoolExecutor] = None
+_PARSE_POOL_KEY: Tuple[int, bytes] = (0, b"")
+_PARSE_POOL_LOCK = threading.Lock()
+
+
+def resolve_workers(workers: int) -> int:
+    """``0`` means one worker per CPU."""
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def _pool_context() -> Any:
+    # the pool may first be needed on a serve handler or daemon thread, and forking a
+    # process that has other threads can leave inherited locks held in the child
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _worker_parsers() -> Optional[bytes]:
+    """Pickle the parsers registered on top of the built-in ones, for the pool workers.
+
+    Returns ``None`` when one of them cannot be pickled (a lambda or closure),
+    in which case the caller parses in-process instead.
+    """
+    extra = {scheme: func for scheme, func in PARSERS.items() if _BUILTIN_PARSERS.get(scheme) is not func}
+    try:
+        return pickle.dumps(extra)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return None
+
+
+def _init_parse_worker(parsers: bytes) -> None:
+    PARSERS.update(pickle.loads(parsers))
+
+
+def get_parse_pool(workers: int, parsers: bytes) -> ProcessPoolExecutor:
+    """Return the process-wide parsing pool, (re)creating it for ``workers`` processes.
+
+    The pool is kept across runs so interval and serve modes pay its startup once.
+    Workers are started with ``forkserver`` (``spawn`` where unavailable), never a
+    bare ``fork``, so they import this module afresh; ``parsers`` (from
+    ``_worker_parsers``) re-registers the parsers added since in every worker, and
+    the pool is replaced when that set changes.
+    """
+    global _PARSE_POOL, _PARSE_POOL_KEY
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None or _PARSE_POOL_KEY != (workers, parsers):
+            if _PARSE_POOL is not None:
+                _PARSE_POOL.shutdown(wait=False)
+            _PARSE_POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=_pool_context(),
+                initializer=_init_parse_worker,
+                initargs=(parsers,),
+            )
+            _PARSE_POOL_KEY = (workers, parsers)
+        return _PARSE_POOL
+
+
+def shutdown_parse_pool() -> None:
+    """Stop the parsing pool, if one was started; the next parallel parse starts a new one."""
+    global _PARSE_POOL, _PARSE_POOL_KEY
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is not None:
+            _PARSE_POOL.shutdown()
+        _PARSE_POOL, _PARSE_POOL_KEY = None, (0, b"")
+
+
+def _parse_chunk(lines: List[str], allow_native_ssr: bool) -> List[Tuple[Optional[Proxy], Optional[str]]]:
+    return [_parse_entry(line, allow_native_ssr) for line in lines]
+
+
+def _batched(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    it = iter(items)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_parsed_lines_parallel(
+    lines: Iterable[str],
+    allow_native_ssr: bool = False,
+    cache: Optional[ParseCache] = None,
+    workers: int = 1,
+    name_filter: Optional["NameFilter"] = None,
+    schemes: Optional[Dict[str, SchemeStats]] = None,
+) -> Iterator[Tuple[Optional[Proxy], Optional[str]]]:
+    """Like ``iter_parsed_lines``, but parse chunks of lines in a pool of ``workers`` processes.
+
+    Results come back in input order with the same warnings as the serial path.
+    Cache lookups and stores stay in this process; only misses are shipped to the
+    pool, and at most ``2 * workers`` chunks are in flight so ``lines`` may be a
+    lazy stream. Inputs under ``PARALLEL_PARSE_MIN_LINES`` entries are parsed serially.
+    ``name_filter`` drops nodes by name: a line whose fragment already names a
+    rejected node is skipped before parsing, other nodes are checked once parsed.
+    """
+    if name_filter is None:
+        yield from _iter_parsed_pool(lines, allow_native_ssr, cache, workers, schemes)
+        return
+    entries = (line for line in _iter_entries(lines) if not name_filter.rejects_line(line))
+    for p, warning in _iter_parsed_pool(entries, allow_native_ssr, cache, workers, schemes):
+        if p is None or name_filter.accepts(p.name):
+            yield p, warning
+
+
+def _iter_parsed_pool(
+    lines: Iterable[str],
+    allow_native_ssr: bool,
+    cache: Optional[ParseCache],
+    workers: int,
+    schemes: Optional[Dict[str, SchemeStats]],
+) -> Iterator[Tuple[Optional[Proxy], Optional[str]]]:
+    entries = _iter_entries(lines)
+    head = list(itertools.islice(entries, PARALLEL_PARSE_MIN_LINES))
+    if workers <= 1 or len(head) < PARALLEL_PARSE_MIN_LINES:
+        yield from iter_parsed_lines(
+            itertools.chain(head, entries), allow_native_ssr=allow_native_ssr, cache=cache, schemes=schemes
+        )
+        return
+    parsers = _worker_parsers()
+    pool: Optional[ProcessPoolExecutor] = None
+    if parsers is not None:
+        try:
+            pool = get_parse_pool(workers, parsers)
+        except (OSError, NotImplementedError):
+            # no working multiprocessing here (e.g. no /dev/shm): parse in-process
+            pass
+
+    pending: "deque[Tuple[List[str], List[Optional[Proxy]], List[str], Any]]" = deque()
+    counts: Dict[Tuple[str, bool], int] = {}
+
+    def collect() -> Iterator[Tuple[Optional[Proxy], Optional[str]]]:
+        batch, cached, misses, future = pending.popleft()
+        if future is None:
+            results = _parse_chunk(misses, allow_native_ssr) if misses else []
+        else:
+            try:
+                results = future.result()
+            except BrokenProcessPool:
+                results = _parse_chunk(misses, allow_native_ssr)
+        parsed = iter(results)
+        for line, p in zip(batch, cached):
+            warning = None
+            if p is None:
+                p, warning = next(parsed)
+                if p and cache is not None:
+                    cache.put(line, allow_native_ssr, p)
+            key = (line_scheme(line), p is not None)
+            counts[key] = counts.get(key, 0) + 1
+            yield p, warning
+
+    try:
+        for batch in _batched(itertools.chain(head, entries), PARSE_CHUNK_LINES):
+            cached = [cache.get(line, allow_native_ssr) if cache is not None else None for line in batch]
+            misses = [line for line, p in zip(batch, cached) if p is None]
+            future = None
+            if pool is not None and misses:
+                try:
+                    future = pool.submit(_parse_chunk, misses, allow_native_ssr)
+                except (BrokenProcessPool, RuntimeError):
+                    pool = None
+            pending.append((batch, cached, misses, future))
+            if len(pending) >= 2 * workers:
+                yield from collect()
+        while pending:
+            yield from collect()
+    finally:
+        _record_schemes(counts, schemes)
+
+
+def parse_lines_to_proxies(
+    lines: List[str],
+    allow_native_ssr: bool = False,
+    cache: Optional[ParseCache] = None,
+    workers: int = 1,
+    name_filter: Optional["NameFilter"] = None,
+    schemes: Optional[Dict[str, SchemeStats]] = None,
+) -> Tuple[List[Proxy], List[str]]:
+    proxies: List[Proxy] = []
+    warnings: List[str] = []
+    parsed = iter_parsed_lines_parallel(
+        lines,
+        allow_native_ssr=allow_native_ssr,
+        cache=cache,
+        workers=workers,
+        name_filter=name_filter,
+        schemes=schemes,
+    )
+    for p, warning in parsed:
+        if p is not None:
+            proxies.append(p)
+        else:
+            warnings.append(warning or "")
+    return proxies, warnings
+
+
+AUTO_GROUP_NAME = "Auto"
+AUTO_GROUP_TYPES = ("url-test", "fallback")
+AUTO_GROUP_TEST_URL = "http://www.gstatic.com/generate_204"
+
+
+@dataclass
+class ProbeSettings:
+    """TCP connect-latency probing, and the automatic group built from its results."""
+
+    timeout: float = 2.0
+    deadline: float = 15.0
+    concurrency: int = 64
+    group_type: str = "url-test"
+    group_size: int = 10
+
+
+async def _tcp_connect(host: str, port: int) -> None:
+    _, writer = await asyncio.open_connection(host, port)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+
+async def probe_latency_async(
+    endpoints: Iterable[Tuple[str, int]],
+    timeout: float = 2.0,
+    deadline: float = 15.0,
+    concurrency: int = 64,
+    connect: Callable[[str, int], Awaitable[Any]] = _tcp_connect,
+) -> Dict[Tuple[str, int], Optional[float]]:
+    """Time a TCP connect (DNS lookup included) to each ``(host, port)``, in seconds.
+
+    At most ``concurrency`` connects are in flight, each gets ``timeout`` seconds,
+    and whatever has not finished ``deadline`` seconds after the start is cancelled.
+    Unreachable or unfinished endpoints map to None. ``connect`` can be swapped
+    for a stand-in, e.g. one that sleeps before connecting to a local listener.
+    """
+    limit = asyncio.Semaphore(max(1, concurrency))
+    results: Dict[Tuple[str, int], Optional[float]] = {}
+
+    async def probe(endpoint: Tuple[str, int]) -> None:
+        async with limit:
+            t0 = time.perf_counter()
+            try:
+                await asyncio.wait_for(connect(*endpoint), timeout)
+            except Exception:
+                return
+            results[endpoint] = time.perf_counter() - t0
+
+    unique = list(dict.fromkeys(endpoints))
+    tasks = [asyncio.ensure_future(probe(ep)) for ep in unique]
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return {ep: results.get(ep) for ep in unique}
+
+
+def probe_latency(
+    proxies: Sequence[Proxy],
+    settings: Optional[ProbeSettings] = None,
+    connect: Optional[Callable[[str, int], Awaitable[Any]]] = None,
+) -> List[Optional[float]]:
+    """Connect latency per proxy, in the order of ``proxies``; nodes sharing an endpoint are probed once."""
+    settings = settings or ProbeSettings()
+    endpoints = [(str(p.server), int(p.port or 0)) for p in proxies]
+    results = asyncio.run(
+        probe_latency_async(
+            endpoints,
+            timeout=settings.timeout,
+            deadline=settings.deadline,
+            concurrency=settings.concurrency,
+            connect=connect or _tcp_connect,
+        )
+    )
+    return [results[ep] for ep in endpoints]
+
+
+def build_proxy_groups(
+    proxy_names: List[str],
+    auto_names: Optional[List[str]] = None,
+    auto_type: str = "url-test",
+) -> List[Dict[str, Any]]:
+    groups: List[Dict[str, Any]] = [
+        {
+            "name": "Proxy",
+            "type": "select",
+            "proxies": ([AUTO_GROUP_NAME] if auto_names else []) + proxy_names + ["DIRECT", "REJECT"],
+        }
+    ]
+    if auto_names:
+        auto: Dict[str, Any] = {
+            "name": AUTO_GROUP_NAME,
+            "type": auto_type,
+            "proxies": auto_names,
+            "url": AUTO_GROUP_TEST_URL,
+            "interval": 300,
+        }
+        if auto_type == "url-test":
+            auto["tolerance"] = 50
+        groups.append(auto)
+    return groups
+
+
+def _proxy_name(proxy: Proxy, index: int) -> str:
+    return proxy.name if proxy.name is not None else f"Proxy-{index}"
+
+
+def build_minimal_clash_yaml(
+    proxies: Sequence[Proxy],
+    profile_name: str,
+    latencies: Optional[Sequence[Optional[float]]] = None,
+    probe: Optional[ProbeSettings] = None,
+) -> Dict[str, Any]:
+    """The Clash config for ``proxies``.
+
+    With ``latencies`` (from ``probe_latency``), the select group lists nodes
+    fastest first, unreachable ones last, and an ``Auto`` group of the
+    ``probe.group_size`` fastest reachable nodes is put in front of them.
+    """
+    proxy_names = [_proxy_name(p, i) for i, p in enumerate(proxies)]
+    auto_names: Optional[List[str]] = None
+    if latencies is not None:
+        probe = probe or ProbeSettings()
+        order = sorted(range(len(proxy_names)), key=lambda i: (latencies[i] is None, latencies[i] or 0.0, i))
+        proxy_names = [proxy_names[i] for i in order]
+        reachable = sum(1 for lat in latencies if lat is not None)
+        auto_names = proxy_names[: min(reachable, max(1, probe.group_size))]
+    config: Dict[str, Any] = {
+        "port": 7890,
+        "socks-port": 7891,
+        "allow-lan": True,
+        "mode": "Rule",
+        "log-level": "info",
+        "external-controller": "127.0.0.1:9090",
+        "proxies": [p.to_clash() for p in proxies],
+        "proxy-groups": build_proxy_groups(proxy_names, auto_names, probe.group_type if probe else "url-test"),
+        "rules": [
+            "MATCH,Proxy",
+        ],
+    }
+    # Optional: add a name into a top-level comment via yaml's header unsupported; keep as is
+    return config
+
+
+YAML_EMITTERS = ("auto", "libyaml", "python")
+
+# Strings libyaml renders exactly like the pure-Python emitter: printable BMP text
+# (no BOM / NEL / U+2028-2029, which libyaml escapes differently), and short enough
+# or plain ASCII without newlines so that both emitters fold lines identically.
+_LIBYAML_SAFE_TEXT = re.compile("[\n\x20-\x7e\xa0-\u2027\u202a-\ud7ff\ue000-\ufefe\uff00-\ufffd]*\\Z")
+
+
+def _libyaml_emits_identically(obj: Any) -> bool:
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            if not _LIBYAML_SAFE_TEXT.match(item):
+                return False
+            if len(item) > 48 and not (item.isascii() and "\n" not in item):
+                return False
+        elif isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return True
+
+
+def select_yaml_dumper(config: Dict[str, Any], emitter: str = "auto") -> Any:
+    """Pick the PyYAML dumper class for ``emitter``.
+
+    ``libyaml`` uses ``CSafeDumper`` whenever PyYAML was built with libyaml; its output
+    is equivalent YAML, but non-BMP characters such as flag emoji are written as
+    escapes. ``auto`` only uses it when the result is byte-for-byte identical to the
+    pure-Python ``SafeDumper``; ``python`` always uses ``SafeDumper``.
+    """
+    if emitter not in YAML_EMITTERS:
+        raise ValueError(f"未知的 YAML 输出方式: {emitter}")
+    fast = getattr(yaml, "CSafeDumper", None)
+    if fast is None or emitter == "python":
+        return yaml.SafeDumper
+    if emitter == "libyaml" or _libyaml_emits_identically(config):
+        return fast
+    return yaml.SafeDumper
+
+
+def temp_output_path(output: str) -> str:
+    """Create an empty temp file next to ``output``, so it can later be renamed over it."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)), prefix=".sub2clash-", suffix=".tmp")
+    os.close(fd)
+    return tmp_path
+
+
+def _same_bytes(path_a: str, path_b: str, chunk_size: int = STREAM_CHUNK_SIZE) -> bool:
+    try:
+        if os.path.getsize(path_a) != os.path.getsize(path_b):
+            return False
+        with open(path_a, "rb") as fa, open(path_b, "rb") as fb:
+            while True:
+                a = fa.read(chunk_size)
+                if a != fb.read(chunk_size):
+                    return False
+                if not a:
+                    return True
+    except OSError:
+        return False
+
+
+def commit_output(tmp_path: str, output: str) -> bool:
+    """Atomically replace ``output`` with the fully written ``tmp_path``.
+
+    The temp file is fsynced and renamed over ``output``, then the directory is
+    fsynced, so a reader (e.g. a Clash client reloading) sees either the old or
+    the new file, never a truncated one. If the bytes equal the current
+    ``output``, nothing is renamed and the file keeps its mtime, so file watchers
+    do not fire. Returns whether ``output`` was replaced; ``tmp_path`` is gone
+    afterwards either way.
+    """
+    try:
+        if _same_bytes(tmp_path, output):
+            return False
+        with open(tmp_path, "r+b") as f:
+            os.fsync(f.fileno())
+        _copy_output_mode(tmp_path, output)
+        os.replace(tmp_path, output)
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(output)), os.O_RDONLY)
+        except OSError:
+            # directories cannot be opened (or fsynced) on every platform
+            return True
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_yaml_to_file(config: Dict[str, Any], output_path: str, emitter: str = "auto") -> bool:
+    """Write ``config`` to ``output_path`` through ``commit_output``; False if the file already had these bytes."""
+    if yaml is None:
+        raise RuntimeError("PyYAML 未安装，请先安装依赖：pip install -r requirements.txt")
+    dumper = select_yaml_dumper(config, emitter)
+    tmp_path = temp_output_path(output_path)
+    try:
+        # Ensure UTF-8 and avoid aliases
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            yaml.dump(config, f, Dumper=dumper, sort_keys=False, allow_unicode=True)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return commit_output(tmp_path, output_path)
+
+
+def dump_yaml(config: Dict[str, Any], emitter: str = "auto") -> str:
+    """Render ``config`` exactly as ``write_yaml_to_file`` would write it."""
+    if yaml is None:
+        raise RuntimeError("PyYAML 未安装，请先安装依赖：pip install -r requirements.txt")
+    dumper = select_yaml_dumper(config, emitter)
+    return yaml.dump(config, Dumper=dumper, sort_keys=False, allow_unicode=True)
+
+
+# Characters that may appear unescaped in a single-quoted scalar; anything else
+# (control characters, NEL, LS/PS, BOM, lone surrogates) forces double quotes.
+_YAML_PRINTABLE = re.compile("[\x20-\x7e\xa0-\u2027\u202a-\ud7ff\ue000-\ufefe\uff00-\ufffd\U00010000-\U0010ffff]*\\Z")
+_YAML_PLAIN_FIRST = re.compile(r"[^-?:,\[\]{}#&*!|>'\"%@` ]")
+_YAML_ESCAPES = {"\0": "\\0", "\t": "\\t", "\n": "\\n", "\r": "\\r", '"': '\\"', "\\": "\\\\"}
+_YAML_RESOLVER = yaml.resolver.Resolver() if yaml is not None else None
+
+
+def _yaml_double_quoted(value: str) -> str:
+    out = []
+    for ch in value:
+        if ch in _YAML_ESCAPES:
+            out.append(_YAML_ESCAPES[ch])
+        elif _YAML_PRINTABLE.match(ch):
+            out.append(ch)
+        elif ord(ch) <= 0xFF:
+            out.append(f"\\x{ord(ch):02X}")
+        elif ord(ch) <= 0xFFFF:
+            out.append(f"\\u{ord(ch):04X}")
+        else:
+            out.append(f"\\U{ord(ch):08X}")
+    return '"' + "".join(out) + '"'
+
+
+@lru_cache(maxsize=4096, typed=True)
+def yaml_scalar(value: Any) -> str:
+    """Render a scalar as a YAML 1.1 token that ``yaml.safe_load`` reads back unchanged."""
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if value != value:
+            return ".nan"
+        if value in (float("inf"), float("-inf")):
+            return ".inf" if value > 0 else "-.inf"
+        return repr(value)
+    value = str(value)
+    if not value:
+        return "''"
+    if not _YAML_PRINTABLE.match(value):
+        return _yaml_double_quoted(value)
+    if (
+        _YAML_PLAIN_FIRST.match(value)
+        and not value.endswith((" ", ":"))
+        and ": " not in value
+        and " #" not in value
+        and _YAML_RESOLVER.resolve(yaml.ScalarNode, value, (True, False)) == "tag:yaml.org,2002:str"
+    ):
+        return value
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _write_yaml_block(f: TextIO, value: Any, indent: int) -> None:
+    """Write the block-style body of ``value`` (a mapping or sequence) at ``indent`` spaces."""
+    pad = " " * indent
+    if isinstance(value, dict):
+        for k, v in value.items():
+            f.write(f"{pad}{yaml_scalar(k)}:")
+            _write_yaml_value(f, v, indent, in_mapping=True)
+    else:
+        for item in value:
+            if isinstance(item, dict) and item:
+                # first key shares the line with the dash, like PyYAML
+                lead = f"{pad}- "
+                for k, v in item.items():
+                    f.write(f"{lead}{yaml_scalar(k)}:")
+                    _write_yaml_value(f, v, indent + 2, in_mapping=True)
+                    lead = f"{pad}  "
+            else:
+                f.write(f"{pad}-")
+                _write_yaml_value(f, item, indent, in_mapping=False)
+
+
+def _write_yaml_value(f: TextIO, value: Any, indent: int, in_mapping: bool) -> None:
+    if isinstance(value, dict) and value:
+        f.write("\n")
+        _write_yaml_block(f, value, indent + 2)
+    elif isinstance(value, list) and value:
+        f.write("\n")
+        # PyYAML does not indent sequences nested in mappings
+        _write_yaml_block(f, value, indent if in_mapping else indent + 2)
+    elif isinstance(value, dict):
+        f.write(" {}\n")
+    elif isinstance(value, list):
+        f.write(" []\n")
+    else:
+        f.write(f" {yaml_scalar(value)}\n")
+
+
+def write_clash_yaml_stream(proxies: Iterable[Proxy], profile_name: str, output_path: str) -> int:
+    """Write the config of ``build_minimal_clash_yaml`` without going through PyYAML.
+
+    Proxies are written one at a time as ``proxies`` yields them; only their names
+    are kept, for the proxy group. Returns the number of proxies written.
+    """
+    template = build_minimal_clash_yaml([], profile_name)
+    names: List[str] = []
+    with open(output_path, "w", encoding="utf-8") as f:
+        for key, value in template.items():
+            if key == "proxies":
+                f.write("proxies:")
+                for i, proxy in enumerate(proxies):
+                    if not names:
+                        f.write("\n")
+                    names.append(_proxy_name(proxy, i))
+                    _write_yaml_block(f, [proxy.to_clash()], 0)
+                if not names:
+                    f.write(" []\n")
+                continue
+            if key == "proxy-groups":
+                value = build_proxy_groups(names)
+            f.write(f"{yaml_scalar(key)}:")
+            _write_yaml_value(f, value, 0, in_mapping=True)
+    return len(names)
+
+
+_CODE_FINGERPRINT: Optional[str] = None
+
+
+def _code_fingerprint() -> str:
+    """Hash of this script, so an upgraded converter never reuses an old digest."""
+    global _CODE_FINGERPRINT
+    if _CODE_FINGERPRINT is None:
+        try:
+            with open(os.path.abspath(__file__), "rb") as f:
+                _CODE_FINGERPRINT = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            _CODE_FINGERPRINT = ""
+    return _CODE_FINGERPRINT
+
+
+def _pipeline_hasher(options: Dict[str, Any]) -> Any:
+    h = hashlib.sha256()
+    h.update(_code_fingerprint().encode("ascii"))
+    h.update(json.dumps(options, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    h.update(b"\0")
+    return h
+
+
+def pipeline_digest(raws: Union[bytes, Sequence[bytes]], options: Dict[str, Any]) -> str:
+    """Digest of the fetched bytes plus every option that affects the rendered output."""
+    h = _pipeline_hasher(options)
+    for raw in [raws] if isinstance(raws, bytes) else raws:
+        h.update(len(raw).to_bytes(8, "big"))
+        h.update(raw)
+    return h.hexdigest()
+
+
+def stream_digest(options: Dict[str, Any], source_hashes: Sequence[Any]) -> str:
+    """Counterpart of ``pipeline_digest`` for streamed sources, from one sha256 per source."""
+    h = _pipeline_hasher(options)
+    for source_hash in source_hashes:
+        h.update(source_hash.digest())
+    return h.hexdigest()
+
+
+def _file_sha256(path: str) -> Any:
+    h = hashlib.sha256()
+    for chunk in _iter_file_chunks(path):
+        h.update(chunk)
+    return h
+
+
+def _output_state_path(cache_dir: str, output: str) -> str:
+    key = hashlib.sha256(os.path.abspath(output).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cache_dir, "state", key + ".json")
+
+
+def _output_signature(output: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(output)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def output_is_current(cache_dir: str, output: str, digest: str) -> bool:
+    """True if ``output`` was last written from ``digest`` and has not been touched since."""
+    signature = _output_signature(output)
+    if signature is None:
+        return False
+    try:
+        with open(_output_state_path(cache_dir, output), "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return state.get("digest") == digest and state.get("output") == signature
+
+
+def record_output_digest(cache_dir: str, output: str, digest: str) -> None:
+    path = _output_state_path(cache_dir, output)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"path": os.path.abspath(output), "digest": digest, "output": _output_signature(output)}, f)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class StageTimer:
+    """Wall-clock and CPU time per pipeline stage, plus byte/line/proxy counters and scheme outcomes."""
+
+    def __init__(self) -> None:
+        self.stages: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.counters: "OrderedDict[str, int]" = OrderedDict()
+        # this run's parse outcomes per scheme, unlike the process-wide scheme_stats()
+        self.schemes: Dict[str, SchemeStats] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            acc = self.stages.setdefault(name, [0.0, 0.0])
+            acc[0] += time.perf_counter() - wall0
+            acc[1] += time.process_time() - cpu0
+
+    def count(self, name: str, n: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self, sources: Sequence[Source] = (), file: Optional[TextIO] = None) -> None:
+        out = file or sys.stdout
+        print("各阶段耗时：", file=out)
+        total_wall = total_cpu = 0.0
+        for name, (wall, cpu) in self.stages.items():
+            total_wall += wall
+            total_cpu += cpu
+            print(f"  {name:<8} 墙钟 {wall * 1000:10.1f} ms   CPU {cpu * 1000:10.1f} ms", file=out)
+        print(f"  {'total':<8} 墙钟 {total_wall * 1000:10.1f} ms   CPU {total_cpu * 1000:10.1f} ms", file=out)
+        if self.counters:
+            print("  " + "  ".join(f"{k}={v}" for k, v in self.counters.items()), file=out)
+        if self.schemes:
+            print(
+                "  协议："
+                + "  ".join(f"{scheme or '?'} {st.parsed}/{st.parsed + st.failed}" for scheme, st in self.schemes.items()),
+                file=out,
+            )
+        stats = mirror_stats()
+        for url in [m for src in sources for m in source_mirrors(src) if m in stats]:
+            st = stats[url]
+            print(
+                f"  {url}: 请求 {st.attempts} 次，胜出 {st.wins}，落后 {st.losses}，失败 {st.failures}，"
+                f"平均响应 {st.mean_seconds * 1000:.1f} ms",
+                file=out,
+            )
+
+
+def run_once(
+    url: Union[str, Sequence[Source]],
+    output: str,
+    name: str,
+    allow_native_ssr: bool = False,
+    cache_dir: Optional[str] = None,
+    parse_cache_size: int = 50000,
+    yaml_emitter: str = "auto",
+    stream: bool = False,
+    per_host_limit: int = 2,
+    timings: bool = False,
+    workers: int = 1,
+    dedupe: str = "first",
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    probe: Optional[ProbeSettings] = None,
+) -> int:
+    """Fetch, parse and write once. Return 0 on success, non-zero on failure.
+
+    ``url`` may be a list of sources; they are fetched concurrently (at most
+    ``per_host_limit`` per host) and merged into one config, in order. A source
+    that is itself a list names mirrors of one subscription, which are raced.
+    With ``cache_dir`` set, a 304 Not Modified reply skips parsing and writing
+    as long as ``output`` already exists, and so does a subscription whose bytes
+    (and effective options) hash to the digest recorded for the last write.
+    Parsed lines are memoized in an on-disk LRU of ``parse_cache_size`` entries.
+    ``stream`` runs the whole pipeline as generators, from chunked download to
+    ``write_clash_yaml_stream``, so memory stays flat whatever the subscription size;
+    multiple sources are then read one after another.
+    ``timings`` prints per-stage wall/CPU time and byte/line/proxy counts at the end.
+    ``workers`` > 1 parses large subscriptions in that many processes (0: one per CPU).
+    ``dedupe`` is a ``dedupe_proxies`` policy for collapsing repeated nodes; in
+    stream mode only ``first`` and ``off`` are possible, since names are written as they come.
+    ``include``/``exclude`` are keywords or regexes matched against node names (see ``NameFilter``).
+    ``probe`` measures TCP latency to every node and adds an automatic group of the
+    fastest ones; it needs all nodes before writing, so it always runs buffered, and
+    since latencies change it never skips a conversion because the input is unchanged.
+    """
+    urls: List[Source] = [url] if isinstance(url, str) else list(url)
+    options = {
+        "sources": urls,
+        "name": name,
+        "allow_native_ssr": allow_native_ssr,
+        "yaml_emitter": yaml_emitter,
+        "stream": stream,
+        "dedupe": dedupe,
+        "include": list(include),
+        "exclude": list(exclude),
+        "probe": asdict(probe) if probe else None,
+    }
+    timer = StageTimer()
+    parse_cache = get_parse_cache(cache_dir, parse_cache_size) if cache_dir and parse_cache_size > 0 else None
+    if stream and probe is None:
+        code = _run_once_stream(urls, output, name, options, cache_dir, parse_cache, timer, workers)
+    else:
+        code = _run_once_buffered(
+            urls, output, name, options, cache_dir, parse_cache, timer, per_host_limit, workers, probe
+        )
+    if parse_cache is not None:
+        with timer.stage("cache"):
+            parse_cache.save()
+    if timings:
+        timer.report(urls)
+    if code not in (0, 2) and cache_dir:
+        # don't let a later 304 skip over a conversion that never made it to disk
+        for u in urls:
+            for mirror in source_mirrors(u):
+                forget_fetch_cache(cache_dir, mirror)
+    return code
+
+
+def _report_fetch_error(urls: List[Source], url: Source, error: BaseException) -> None:
+    where = f" ({' | '.join(source_mirrors(url))})" if len(urls) > 1 else ""
+    print(f"拉取订阅失败{where}: {error}", file=sys.stderr)
+
+
+def _run_once_buffered(
+    urls: List[Source],
+    output: str,
+    name: str,
+    options: Dict[str, Any],
+    cache_dir: Optional[str],
+    parse_cache: Optional[ParseCache],
+    timer: StageTimer,
+    per_host_limit: int = 2,
+    workers: int = 1,
+    probe: Optional[ProbeSettings] = None,
+) -> int:
+    with timer.stage("fetch"):
+        results = fetch_many(urls, cache_dir=cache_dir, per_host_limit=per_host_limit)
+    fetched: List[FetchResult] = []
+    for u, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            _report_fetch_error(urls, u, result)
+            return 2
+        fetched.append(result)
+        timer.count("bytes", len(result.raw))
+        if len(source_mirrors(u)) > 1:
+            print(f"[{_now()}] 镜像竞速：{result.url} 最先响应")
+
+    # a 304 only says the body matches the fetch cache; whether this output was
+    # rendered from it, with these options, is for the digest to decide
+    digest = None
+    if cache_dir:
+        with timer.stage("digest"):
+            digest = pipeline_digest([f.raw for f in fetched], options)
+        if probe is None and output_is_current(cache_dir, output, digest):
+            print(f"[{_now()}] 订阅内容未变化，跳过转换: {output}")
+            return 0
+
+    with timer.stage("decode"):
+        texts = [f.text for f in fetched]
+    with timer.stage("split"):
+        lines: List[str] = []
+        for text in texts:
+            lines.extend(split_lines_keep_schemes(text))
+    timer.count("lines", len(lines))
+    with timer.stage("parse"):
+        name_filter = NameFilter(options["include"], options["exclude"])
+        proxies, warnings = parse_lines_to_proxies(
+            lines,
+            allow_native_ssr=options["allow_native_ssr"],
+            cache=parse_cache,
+            workers=resolve_workers(workers),
+            name_filter=name_filter or None,
+            schemes=timer.schemes,
+        )
+    with timer.stage("dedupe"):
+        proxies, duplicates = dedupe_proxies(proxies, options["dedupe"])
+        renamed = ensure_unique_names(proxies, RESERVED_PROXY_NAMES + ((AUTO_GROUP_NAME,) if probe else ()))
+    timer.count("proxies", len(proxies))
+    timer.count("filtered", name_filter.rejected)
+    timer.count("duplicates", duplicates)
+    timer.count("renamed", renamed)
+    timer.count("warnings", len(warnings))
+
+    if not proxies:
+        _report_no_proxies(warnings)
+        return 3
+
+    latencies = None
+    if probe is not None:
+        with timer.stage("probe"):
+            latencies = probe_latency(proxies, probe)
+        _report_probe(latencies)
+
+    try:
+        with timer.stage("write"):
+            config = build_minimal_clash_yaml(proxies, name, latencies, probe)
+            changed = write_yaml_to_file(config, output, emitter=options["yaml_emitter"])
+    except Exception as e:
+        print(f"写入 YAML 失败: {e}", file=sys.stderr)
+        return 4
+
+    if cache_dir and digest:
+        record_output_digest(cache_dir, output, digest)
+    _report_written(
+        output, len(proxies), warnings, len(warnings), duplicates, renamed, name_filter.rejected, changed
+    )
+    return 0
+
+
+def _run_once_stream(
+    urls: List[Source],
+    output: str,
+    name: str,
+    options: Dict[str, Any],
+    cache_dir: Optional[str],
+    parse_cache: Optional[ParseCache],
+    timer: StageTimer,
+    workers: int = 1,
+) -> int:
+    streams: List[FetchStream] = []
+    try:
+        for u in urls:
+            try:
+                with timer.stage("fetch"):
+                    streams.append(stream_subscription(u, cache_dir=cache_dir))
+            except Exception as e:
+                _report_fetch_error(urls, u, e)
+                return 2
+            if len(source_mirrors(u)) > 1:
+                print(f"[{_now()}] 镜像竞速：{streams[-1].url} 最先响应")
+        return _convert_streams(urls, streams, output, name, options, cache_dir, parse_cache, timer, workers)
+    finally:
+        for fs in streams:
+            fs.close()
+
+
+def _convert_streams(
+    urls: List[Source],
+    streams: List[FetchStream],
+    output: str,
+    name: str,
+    options: Dict[str, Any],
+    cache_dir: Optional[str],
+    parse_cache: Optional[ParseCache],
+    timer: StageTimer,
+    workers: int,
+) -> int:
+    if cache_dir and all(fs.not_modified for fs in streams):
+        # every body is already on disk, so the digest can be checked before parsing
+        with timer.stage("digest"):
+            digest = stream_digest(
+                options, [_file_sha256(_fetch_cache_paths(cache_dir, fs.url)[1]) for fs in streams]
+            )
+        if output_is_current(cache_dir, output, digest):
+            print(f"[{_now()}] 订阅内容未变化，跳过转换: {output}")
+            return 0
+
+    # one digest per source, combined at the end like pipeline_digest does
+    source_hashes: List[Any] = []
+    fetch_errors: List[Tuple[Source, Exception]] = []
+
+    def hashed_chunks(u: Source, fs: FetchStream) -> Iterator[bytes]:
+        h = hashlib.sha256()
+        source_hashes.append(h)
+        try:
+            for chunk in fs.chunks:
+                h.update(chunk)
+                timer.count("bytes", len(chunk))
+                yield chunk
+        except Exception as e:
+            fetch_errors.append((u, e))
+            raise
+
+    # keep only the first few warnings so memory does not grow with malformed lines
+    warnings: List[str] = []
+    warning_count = 0
+    duplicates = 0
+    emitted = 0
+    names = UniqueNames()
+    name_filter = NameFilter(options["include"], options["exclude"])
+    # digests rather than identity tuples, so memory stays small as nodes stream past
+    seen: Optional[set] = set() if options["dedupe"] != "off" else None
+
+    def proxies() -> Iterator[Proxy]:
+        nonlocal warning_count, duplicates, emitted
+        lines = itertools.chain.from_iterable(
+            iter_subscription_lines(hashed_chunks(u, fs)) for u, fs in zip(urls, streams)
+        )
+        parsed = iter_parsed_lines_parallel(
+            lines,
+            allow_native_ssr=options["allow_native_ssr"],
+            cache=parse_cache,
+            workers=resolve_workers(workers),
+            name_filter=name_filter or None,
+            schemes=timer.schemes,
+        )
+        for p, warning in parsed:
+            timer.count("lines", 1)
+            if p is not None:
+                if seen is not None:
+                    key = identity_digest(p)
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                p.name = names.claim(_proxy_name(p, emitted))
+                emitted += 1
+                yield p
+            else:
+                warning_count += 1
+                if len(warnings) < 10:
+                    warnings.append(warning or "")
+
+    try:
+        tmp_path = temp_output_path(output)
+    except OSError as e:
+        print(f"写入 YAML 失败: {e}", file=sys.stderr)
+        return 4
+    try:
+        try:
+            # fetch, decode, parse and write are interleaved, so they share one stage
+            with timer.stage("stream"):
+                count = write_clash_yaml_stream(proxies(), name, tmp_path)
+            timer.count("proxies", count)
+            timer.count("filtered", name_filter.rejected)
+            timer.count("duplicates", duplicates)
+            timer.count("renamed", names.renamed)
+            timer.count("warnings", warning_count)
+        except Exception as e:
+            if fetch_errors:
+                _report_fetch_error(urls, *fetch_errors[0])
+                return 2
+            print(f"写入 YAML 失败: {e}", file=sys.stderr)
+            return 4
+
+        if not count:
+            _report_no_proxies(warnings)
+            return 3
+
+        digest = stream_digest(options, source_hashes)
+        if cache_dir and output_is_current(cache_dir, output, digest):
+            print(f"[{_now()}] 订阅内容未变化，跳过写入: {output}")
+            return 0
+        try:
+            changed = commit_output(tmp_path, output)
+        except OSError as e:
+            print(f"写入 YAML 失败: {e}", file=sys.stderr)
+            return 4
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if cache_dir:
+        record_output_digest(cache_dir, output, digest)
+    _report_written(
+        output, count, warnings, warning_count, duplicates, names.renamed, name_filter.rejected, changed
+    )
+    return 0
+
+
+def _copy_output_mode(tmp_path: str, output: str) -> None:
+    """Give a temp file the permissions ``open(output, "w")`` would have produced."""
+    try:
+        mode = os.stat(output).st_mode & 0o7777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    try:
+        os.chmod(tmp_path, mode)
+    except OSError:
+        pass
+
+
+def _report_no_proxies(warnings: List[str]) -> None:
+    print("未能解析到任何有效节点。", file=sys.stderr)
+    if warnings:
+        for w in warnings[:10]:
+            print(f"提示: {w}", file=sys.stderr)
+
+
+def _report_probe(latencies: Sequence[Optional[float]]) -> None:
+    reachable = sorted(lat for lat in latencies if lat is not None)
+    if not reachable:
+        print(f"[{_now()}] 测速完成：{len(latencies)} 个节点均无法连接，不生成自动选择组。")
+        return
+    median = reachable[len(reachable) // 2]
+    print(
+        f"[{_now()}] 测速完成：{len(reachable)}/{len(latencies)} 个节点可连接，"
+        f"最快 {reachable[0] * 1000:.0f} ms，中位数 {median * 1000:.0f} ms。"
+    )
+
+
+def _report_written(
+    output: str,
+    count: int,
+    warnings: List[str],
+    warning_count: int,
+    duplicates: int = 0,
+    renamed: int = 0,
+    filtered: int = 0,
+    changed: bool = True,
+) -> None:
+    notes = []
+    if filtered:
+        notes.append(f"按名称过滤 {filtered} 个节点")
+    if duplicates:
+        notes.append(f"已合并 {duplicates} 个重复节点")
+    if renamed:
+        notes.append(f"{renamed} 个重名节点已加编号")
+    if not changed:
+        notes.append("内容与现有文件相同，未改写")
+    extra = f"（{'，'.join(notes)}）" if notes else ""
+    print(f"[{_now()}] 已生成 Clash 配置: {output}，共 {count} 个节点{extra}。")
+    if warning_count:
+        print(f"注意：有 {warning_count} 条警告/未支持节点，前几条：")
+        for w in warnings[:10]:
+            print(f"- {w}")
+
+
+RUN_CHANGED = "changed"
+RUN_UNCHANGED = "unchanged"
+RUN_FAILED = "failed"
+ADAPTIVE_BACKOFF = 2.0
+ADAPTIVE_MAX_FACTOR = 8.0
+
+
+class RefreshScheduler:
+    """Monotonic-clock timetable for periodic conversions.
+
+    Run ``k`` is due at ``start + k * period`` however long each conversion takes,
+    so the period does not drift; a run that overran skips the slots it missed
+    instead of firing them back to back. ``jitter`` (a fraction of the period)
+    moves each run by a random offset without moving the timetable, so hosts
+    started together spread their requests out. With ``adaptive`` set, every
+    unchanged or failed run doubles the period up to ``max_interval`` and a run
+    that changed the output returns it to ``interval``.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        jitter: float = 0.0,
+        adaptive: bool = False,
+        max_interval: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.interval = interval
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.adaptive = adaptive
+        self.max_interval = max(interval, max_interval or interval * ADAPTIVE_MAX_FACTOR)
+        self.period = interval
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._slot = clock()
+        self._due = self._slot
+
+    def remaining(self) -> float:
+        """Seconds until the next run is due (0 if it already is)."""
+        return max(0.0, self._due - self._clock())
+
+    def record(self, outcome: str) -> float:
+        """Plan the run after one that ended with ``outcome`` (a ``RUN_*`` value); return the new period."""
+        if self.adaptive:
+            if outcome == RUN_CHANGED:
+                self.period = self.interval
+            else:
+                self.period = min(self.period * ADAPTIVE_BACKOFF, self.max_interval)
+        now = self._clock()
+        self._slot += self.period
+        if self._slot < now:
+            self._slot += ((now - self._slot) // self.period + 1) * self.period
+        offset = self._rng.uniform(-self.jitter, self.jitter) * self.period if self.jitter else 0.0
+        self._due = max(now, self._slot + offset)
+        return self.period
+
+
+def run_outcome(code: int, before: Optional[List[int]], output: str) -> str:
+    """Classify a finished ``run_once`` for ``RefreshScheduler.record``.
+
+    Skipped conversions and byte-identical rewrites leave ``output`` alone, so
+    comparing its size and mtime with ``before`` tells whether anything changed.
+    """
+    if code != 0:
+        return RUN_FAILED
+    return RUN_UNCHANGED if _output_signature(output) == before else RUN_CHANGED
+
+
+class RefreshSignals:
+    """SIGHUP/SIGUSR1 requests for a long-running loop: reload the configuration, or run right away.
+
+    The handlers only set flags, wake ``wait`` and call ``wake`` (for loops that
+    block elsewhere, e.g. ``FileWatcher.wakeup``), so the loop picks the request
+    up between conversions and everything held in memory (parse caches, pooled
+    HTTP connections, the parse process pool) carries on as it was.
+    """
+
+    def __init__(self, wake: Optional[Callable[[], None]] = None) -> None:
+        self.reload = False
+        self.run_now = False
+        self.wake = wake
+        self._event = threading.Event()
+
+    def install(self) -> bool:
+        """Route SIGHUP and SIGUSR1 here; False where the platform has neither."""
+        if not hasattr(signal, "SIGHUP") or not hasattr(signal, "SIGUSR1"):
+            return False
+        signal.signal(signal.SIGHUP, self._on_signal)
+        signal.signal(signal.SIGUSR1, self._on_signal)
+        return True
+
+    def _on_signal(self, signum: int, _frame: Any) -> None:
+        if signum == signal.SIGHUP:
+            self.reload = True
+        else:
+            self.run_now = True
+        self._event.set()
+        if self.wake is not None:
+            self.wake()
+
+    def wait(self, timeout: float) -> None:
+        """Sleep ``timeout`` seconds, or until a signal arrives."""
+        self._event.wait(timeout)
+        self._event.clear()
+
+    def take(self) -> Tuple[bool, bool]:
+        """Return and reset ``(reload, run_now)``."""
+        reload, run_now = self.reload, self.run_now
+        self.reload = self.run_now = False
+        return reload, run_now
+
+
+def local_source_path(source: Source) -> Optional[str]:
+    """Filesystem path of a local source; None for HTTP(S) sources and mirror lists."""
+    mirrors = source_mirrors(source)
+    if len(mirrors) != 1 or not is_local_source(mirrors[0]):
+        return None
+    return mirrors[0].replace("file://", "")
+
+
+# <sys/inotify.h>
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct("iIII")
+_INOTIFY_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class FileWatcher:
+    """Wait for changes to a few local files, with inotify on Linux and stat polling elsewhere.
+
+    The parent directories are watched rather than the files, so editors and sync
+    tools that replace a file by renaming a new one over it are still seen. A
+    burst of events is debounced until ``debounce`` seconds pass without another,
+    and ``wait`` only reports a change when a file's inode, size or mtime differs
+    from the last time it returned. ``wakeup`` (safe from a signal handler) makes
+    a pending ``wait`` return early.
+    """
+
+    def __init__(
+        self, paths: Sequence[str], debounce: float = 0.5, poll_interval: float = 1.0, use_inotify: bool = True
+    ) -> None:
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._signatures = {p: _file_signature(p) for p in self.paths}
+        self._names = {(os.path.dirname(p), os.path.basename(p)) for p in self.paths}
+        self._fd: Optional[int] = None
+        self._dirs: Dict[int, str] = {}
+        if use_inotify:
+            try:
+                self._fd = self._init_inotify()
+            except (OSError, AttributeError):
+                self._fd = None
+        # self-pipe: wakeup() writes a byte, every select in wait() also watches the read end
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._woken = False
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self._fd is not None else "polling"
+
+    def _init_inotify(self) -> int:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux-only")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(_IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for directory in sorted({d for d, _ in self._names}):
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), _INOTIFY_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(err, f"inotify_add_watch failed for {directory}")
+            self._dirs[wd] = directory
+        return fd
+
+    def close(self) -> None:
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            if fd is not None and fd >= 0:
+                os.close(fd)
+        self._fd = None
+        self._wake_r = self._wake_w = -1
+
+    def wakeup(self) -> None:
+        """Make the current (or next) ``wait`` return; safe to call from a signal handler."""
+        try:
+            os.write(self._wake_w, b"\0")
+        except (BlockingIOError, OSError):
+            # a full pipe already has a wakeup pending
+            pass
+
+    def _select(self, timeout: Optional[float]) -> bool:
+        """Wait up to ``timeout``; True if inotify has events. A wakeup sets ``_woken``."""
+        fds = [self._wake_r] if self._fd is None else [self._fd, self._wake_r]
+        ready, _, _ = select.select(fds, [], [], timeout)
+        if self._wake_r in ready:
+            try:
+                while os.read(self._wake_r, 512):
+                    pass
+            except BlockingIOError:
+                pass
+            self._woken = True
+        return self._fd is not None and self._fd in ready
+
+    def _read_events(self, timeout: Optional[float]) -> Optional[bool]:
+        """Wait up to ``timeout`` for inotify events; True if one touched a watched file, None on timeout."""
+        assert self._fd is not None
+        if not self._select(timeout):
+            return None
+        data = os.read(self._fd, 64 * 1024)
+        relevant = False
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            wd, _mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if (self._dirs.get(wd), name) in self._names:
+                relevant = True
+        return relevant
+
+    def _changed(self) -> List[str]:
+        changed = []
+        for path in self.paths:
+            sig = _file_signature(path)
+            if sig != self._signatures[path]:
+                self._signatures[path] = sig
+                changed.append(path)
+        return changed
+
+    def wait(self, timeout: Optional[float] = None) -> List[str]:
+        """Block until a watched file changes and has been quiet for ``debounce`` seconds.
+
+        Returns the changed paths, or an empty list once ``timeout`` seconds pass
+        or ``wakeup`` is called. While idle, both backends sleep in ``select``
+        without using CPU.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._woken = False
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if self._woken or (remaining is not None and remaining <= 0):
+                return self._changed() if self._woken else []
+            if self._fd is not None:
+                if not self._read_events(remaining):
+                    continue
+                # debounce: keep draining until the burst is over
+                while not self._woken and self._read_events(self.debounce) is not None:
+                    pass
+            else:
+                self._select(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+                if all(_file_signature(p) == self._signatures[p] for p in self.paths):
+                    continue
+                # debounce: wait until the files stop changing between two looks
+                last = [_file_signature(p) for p in self.paths]
+                while not self._woken:
+                    self._select(self.debounce)
+                    current = [_file_signature(p) for p in self.paths]
+                    if current == last:
+                        break
+                    last = current
+            changed = self._changed()
+            if changed:
+                return changed
+
+
+@dataclass
+class RenderedConfig:
+    """A rendered config held in memory by ``ConfigServer``."""
+
+    body: bytes
+    gzip_body: bytes
+    etag: str
+    proxy_count: int
+    rendered_at: float
+    # pipeline_digest of the fetched bytes it was rendered from
+    digest: str = ""
+
+
+class ConfigServer:
+    """Serve the converted config from memory over HTTP.
+
+    The config is re-rendered on request once it is older than ``max_age``
+    seconds. Concurrent requests during a refresh wait for that single
+    conversion instead of starting their own, and a failed refresh keeps
+    serving the previous config.
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[Source],
+        name: str,
+        max_age: float = 300.0,
+        allow_native_ssr: bool = False,
+        cache_dir: Optional[str] = None,
+        parse_cache_size: int = 50000,
+        yaml_emitter: str = "auto",
+        per_host_limit: int = 2,
+        workers: int = 1,
+        dedupe: str = "first",
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        probe: Optional[ProbeSettings] = None,
+    ) -> None:
+        self.sources = list(sources)
+        self.name = name
+        self.max_age = max_age
+        self.allow_native_ssr = allow_native_ssr
+        self.cache_dir = cache_dir
+        self.parse_cache_size = parse_cache_size
+        self.yaml_emitter = yaml_emitter
+        self.per_host_limit = per_host_limit
+        self.workers = resolve_workers(workers)
+        self.dedupe = dedupe
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._current: Optional[RenderedConfig] = None
+        self._refreshing: Optional[threading.Event] = None
+
+    def options(self) -> Dict[str, Any]:
+        """Settings that affect the rendered config, in the shape ``pipeline_digest`` takes."""
+        return {
+            "sources": self.sources,
+            "name": self.name,
+            "allow_native_ssr": self.allow_native_ssr,
+            "yaml_emitter": self.yaml_emitter,
+            "dedupe": self.dedupe,
+            "include": self.include,
+            "exclude": self.exclude,
+            "probe": asdict(self.probe) if self.probe else None,
+        }
+
+    def render(self) -> RenderedConfig:
+        """Fetch, parse and render once; raises on failure."""
+        results = fetch_many(self.sources, cache_dir=self.cache_dir, per_host_limit=self.per_host_limit)
+        for u, result in zip(self.sources, results):
+            if isinstance(result, BaseException):
+                raise RuntimeError(f"拉取订阅失败 ({' | '.join(source_mirrors(u))}): {result}")
+        fetched = [r for r in results if isinstance(r, FetchResult)]
+        current = self._current
+        digest = pipeline_digest([f.raw for f in fetched], self.options())
+        if current is not None and self.probe is None and current.digest == digest:
+            return replace(current, rendered_at=time.time())
+
+        parse_cache = None
+        if self.cache_dir and self.parse_cache_size > 0:
+            parse_cache = get_parse_cache(self.cache_dir, self.parse_cache_size)
+        lines: List[str] = []
+        for f in fetched:
+            lines.extend(split_lines_keep_schemes(f.text))
+        name_filter = NameFilter(self.include, self.exclude)
+        proxies, warnings = parse_lines_to_proxies(
+            lines,
+            allow_native_ssr=self.allow_native_ssr,
+            cache=parse_cache,
+            workers=self.workers,
+            name_filter=name_filter or None,
+        )
+        if parse_cache is not None:
+            parse_cache.save()
+        proxies, _ = dedupe_proxies(proxies, self.dedupe)
+        ensure_unique_names(proxies, RESERVED_PROXY_NAMES + ((AUTO_GROUP_NAME,) if self.probe else ()))
+        if not proxies:
+            raise RuntimeError("未能解析到任何有效节点。")
+        latencies = probe_latency(proxies, self.probe) if self.probe is not None else None
+        config = build_minimal_clash_yaml(proxies, self.name, latencies, self.probe)
+        body = dump_yaml(config, self.yaml_emitter).encode("utf-8")
+        if current is not None and current.body == body:
+            return replace(current, rendered_at=time.time(), digest=digest)
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        print(f"[{_now()}] 已更新内存中的 Clash 配置，共 {len(proxies)} 个节点，{len(warnings)} 条警告。")
+        return RenderedConfig(body, gzip.compress(body), etag, len(proxies), time.time(), digest)
+
+    def get(self, force: bool = False) -> Optional[RenderedConfig]:
+        """Current config, refreshing it first if stale; None if nothing could be rendered yet.
+
+        ``force`` refreshes even a fresh config, and does not settle for a refresh
+        that was already running when it was called.
+        """
+        while True:
+            with self._lock:
+                current = self._current
+                if not force and current is not None and time.time() - current.rendered_at < self.max_age:
+                    return current
+                waiting = self._refreshing
+                if waiting is None:
+                    self._refreshing = threading.Event()
+                    break
+            waiting.wait()
+            if not force:
+                return self._current
+
+        try:
+            rendered = self.render()
+        except Exception as e:
+            print(f"[{_now()}] 刷新配置失败: {e}", file=sys.stderr)
+            rendered = None
+        with self._lock:
+            if rendered is not None:
+                self._current = rendered
+            event, self._refreshing = self._refreshing, None
+        if event is not None:
+            event.set()
+        return self._current
+
+    def make_handler(self) -> Any:
+        server = self
+        filename = quote(f"{self.name}.yaml")
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                self._respond(send_body=True)
+
+            def do_HEAD(self) -> None:
+                self._respond(send_body=False)
+
+            def _respond(self, send_body: bool) -> None:
+                config = server.get()
+                if config is None:
+                    self.send_error(502, "subscription conversion failed")
+                    return
+                if config.etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                    self.send_response(304)
+                    self.send_header("ETag", config.etag)
+                    self.end_headers()
+                    return
+                use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+                body = config.gzip_body if use_gzip else config.body
+                self.send_response(200)
+                self.send_header("Content-Type", "text/yaml; charset=utf-8")
+                self.send_header("Content-Disposition", f"inline; filename*=UTF-8''{filename}")
+                self.send_header("ETag", config.etag)
+                self.send_header("Vary", "Accept-Encoding")
+                if use_gzip:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                print(f"[{_now()}] {self.address_string()} {format % args}")
+
+        return Handler
+
+    def serve_forever(self, host: str, port: int) -> None:
+        httpd = http.server.ThreadingHTTPServer((host, port), self.make_handler())
+        httpd.daemon_threads = True
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+
+
+def parse_host_port(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"无效的监听地址: {value}（应为 HOST:PORT）")
+    return host.strip("[]") or "0.0.0.0", int(port)
+
+
+DAEMON_JOB_KEYS = (
+    "name",
+    "url",
+    "output",
+    "interval_minutes",
+    "jitter",
+    "adaptive",
+    "max_interval_minutes",
+    "clash_meta",
+    "stream",
+    "dedupe",
+    "include",
+    "exclude",
+    "probe",
+)
+DAEMON_DEFAULT_CONCURRENCY = 4
+
+
+@dataclass
+class DaemonJob:
+    """One subscription managed by ``Daemon``: where it comes from, where it goes and how often."""
+
+    name: str
+    sources: List[Source]
+    output: str
+    interval: float
+    jitter: float = 0.0
+    adaptive: bool = False
+    max_interval: Optional[float] = None
+    # run_once keyword arguments that override the daemon-wide ones
+    options: Dict[str, Any] = field(default_factory=dict)
+
+    def scheduler(self, clock: Callable[[], float] = time.monotonic) -> RefreshScheduler:
+        return RefreshScheduler(self.interval, self.jitter, self.adaptive, self.max_interval, clock=clock)
+
+
+def _daemon_job(entry: Any, defaults: Dict[str, Any], index: int, run_kwargs: Dict[str, Any]) -> DaemonJob:
+    if not isinstance(entry, dict):
+        raise ValueError(f"第 {index} 个订阅应为对象")
+    merged = {**defaults, **entry}
+    unknown = sorted(set(merged) - set(DAEMON_JOB_KEYS))
+    if unknown:
+        raise ValueError(f"第 {index} 个订阅包含未知的配置项: {', '.join(unknown)}")
+    if not merged.get("url") or not merged.get("output"):
+        raise ValueError(f"第 {index} 个订阅缺少 url 或 output")
+
+    def number(key: str, default: float) -> float:
+        value = merged.get(key, default)
+        # JSON true/false would otherwise pass as 1/0
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"第 {index} 个订阅的 {key} 应为数字")
+        return float(value)
+
+    def flag(key: str) -> bool:
+        value = merged.get(key, False)
+        if not isinstance(value, bool):
+            raise ValueError(f"第 {index} 个订阅的 {key} 应为 true 或 false")
+        return value
+
+    url = merged["url"]
+    sources: List[Source] = [url] if isinstance(url, str) else list(url)
+    interval = number("interval_minutes", 60)
+    if interval <= 0:
+        raise ValueError(f"第 {index} 个订阅的 interval_minutes 必须大于 0")
+    max_interval = number("max_interval_minutes", 0)
+    jitter = number("jitter", 0.0)
+
+    options: Dict[str, Any] = {}
+    if "clash_meta" in merged:
+        options["allow_native_ssr"] = flag("clash_meta")
+    if "stream" in merged:
+        options["stream"] = flag("stream")
+    if "dedupe" in merged:
+        options["dedupe"] = merged["dedupe"]
+    for key in ("include", "exclude"):
+        if key in merged:
+            value = merged[key]
+            patterns = [value] if isinstance(value, str) else value
+            if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+                raise ValueError(f"第 {index} 个订阅的 {key} 应为字符串或字符串列表")
+            options[key] = list(patterns)
+    probe = merged.get("probe")
+    if probe:
+        try:
+            options["probe"] = ProbeSettings(**probe) if isinstance(probe, dict) else ProbeSettings()
+        except TypeError as e:
+            raise ValueError(f"第 {index} 个订阅的 probe 配置无效: {e}") from None
+    # check what run_once will actually get, command-line defaults included
+    effective = {**run_kwargs, **options}
+    dedupe = effective.get("dedupe", "first")
+    if dedupe not in DEDUPE_POLICIES:
+        raise ValueError(f"第 {index} 个订阅的 dedupe 无效: {dedupe}")
+    if effective.get("stream") and (effective.get("probe") or dedupe not in ("first", "off")):
+        raise ValueError(
+            f"第 {index} 个订阅以 stream 模式运行，不能使用 probe，dedupe 也只能为 first 或 off"
+            f"（当前为 {dedupe}；命令行选项同样计入）"
+        )
+    output = str(merged["output"])
+    return DaemonJob(
+        name=str(merged.get("name") or os.path.splitext(os.path.basename(output))[0]),
+        sources=sources,
+        output=output,
+        interval=max(1.0, interval * 60),
+        jitter=jitter,
+        adaptive=flag("adaptive"),
+        max_interval=max_interval * 60 if max_interval > 0 else None,
+        options=options,
+    )
+
+
+def load_daemon_config(path: str, run_kwargs: Optional[Dict[str, Any]] = None) -> Tuple[int, List[DaemonJob]]:
+    """Read a daemon config file; return ``(concurrency, jobs)``.
+
+    The file is JSON: ``{"concurrency": 4, "defaults": {...}, "sources": [{...}, ...]}``.
+    Each source takes the keys in ``DAEMON_JOB_KEYS`` (``url`` and ``output`` are
+    required; ``url`` may be a list of sources, and a nested list names mirrors),
+    falling back to ``defaults``. ``run_kwargs`` are the daemon-wide ``run_once``
+    arguments the jobs will run with, so conflicting combinations are caught
+    here. Raises ``ValueError`` for an invalid file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"配置文件不是有效的 JSON: {e}") from None
+    if not isinstance(data, dict) or not isinstance(data.get("sources"), list) or not data["sources"]:
+        raise ValueError("配置文件需要包含非空的 sources 列表")
+    defaults = data.get("defaults", {})
+    if not isinstance(defaults, dict):
+        raise ValueError("defaults 应为对象")
+    jobs = [_daemon_job(entry, defaults, i, run_kwargs or {}) for i, entry in enumerate(data["sources"], 1)]
+    for label, values in (("name", [j.name for j in jobs]), ("output", [os.path.abspath(j.output) for j in jobs])):
+        if len(set(values)) != len(values):
+            raise ValueError(f"多个订阅使用了相同的 {label}")
+    concurrency = data.get("concurrency", DAEMON_DEFAULT_CONCURRENCY)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        raise ValueError("concurrency 应为正整数")
+    return concurrency, jobs
+
+
+class Daemon:
+    """Keep many subscriptions converted, each on its own schedule, from one process.
+
+    Every job's timetable runs as a task on a single asyncio loop, and each
+    conversion is handed to a pool of ``concurrency`` threads, so a slow
+    subscription only ever holds one thread while the others stay on time.
+    The threads share the keep-alive HTTP session, the parse caches and the
+    process pool for large subscriptions. ``run_kwargs`` are the ``run_once``
+    keyword arguments common to every job; a job's own options override them.
+    """
+
+    def __init__(self, jobs: Sequence[DaemonJob], run_kwargs: Dict[str, Any], concurrency: int = DAEMON_DEFAULT_CONCURRENCY) -> None:
+        self.jobs = list(jobs)
+        self.run_kwargs = dict(run_kwargs)
+        self.concurrency = max(1, concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: Dict[str, "asyncio.Task[None]"] = {}
+        self._wake: Dict[str, asyncio.Event] = {}
+
+    def run_job(self, job: DaemonJob) -> int:
+        """Convert ``job`` once, in the calling thread."""
+        try:
+            return run_once(job.sources, job.output, job.name, **{**self.run_kwargs, **job.options})
+        except Exception as e:
+            print(f"[{_now()}] {job.name}：转换失败: {e}", file=sys.stderr)
+            return 1
+
+    async def _job_loop(self, job: DaemonJob, wake: asyncio.Event) -> None:
+        loop = asyncio.get_running_loop()
+        scheduler = job.scheduler(clock=loop.time)
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), scheduler.remaining())
+            except asyncio.TimeoutError:
+                on_schedule = True
+            else:
+                on_schedule = False
+            wake.clear()
+            before = _output_signature(job.output)
+            code = await loop.run_in_executor(self._executor, self.run_job, job)
+            if not on_schedule:
+                # an on-demand run leaves the timetable (and the adaptive period) alone
+                continue
+            previous = scheduler.period
+            period = scheduler.record(run_outcome(code, before, job.output))
+            if period != previous:
+                print(f"[{_now()}] {job.name}：更新间隔调整为 {period / 60:g} 分钟")
+
+    def _start(self, job: DaemonJob) -> None:
+        self._wake[job.name] = asyncio.Event()
+        self._tasks[job.name] = asyncio.get_running_loop().create_task(self._job_loop(job, self._wake[job.name]))
+
+    def _stop(self, name: str) -> None:
+        # a conversion already handed to a thread still finishes, and still writes atomically
+        self._tasks.pop(name).cancel()
+        del self._wake[name]
+
+    def run_now(self) -> None:
+        """Start a conversion of every job right away, without moving their schedules."""
+        for wake in self._wake.values():
+            wake.set()
+
+    def reload(self, jobs: Sequence[DaemonJob]) -> Tuple[int, int, int]:
+        """Switch to a new job list; return how many jobs were ``(added, changed, removed)``.
+
+        Jobs whose settings are unchanged keep their task and timetable; the rest
+        are restarted, which converts them straight away. Must be called on the
+        loop that is running ``run``.
+        """
+        current = {job.name: job for job in self.jobs}
+        wanted = {job.name: job for job in jobs}
+        added = changed = removed = 0
+        for name in current:
+            if name not in wanted:
+                self._stop(name)
+                removed += 1
+        for name, job in wanted.items():
+            if name not in current:
+                added += 1
+            elif current[name] != job:
+                self._stop(name)
+                changed += 1
+            else:
+                continue
+            self._start(job)
+        self.jobs = list(jobs)
+        return added, changed, removed
+
+    async def run(self) -> None:
+        """Run every job's schedule until cancelled."""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="sub2clash") as executor:
+            self._executor = executor
+            for job in self.jobs:
+                self._start(job)
+            try:
+                await asyncio.Event().wait()
+            finally:
+                for name in list(self._tasks):
+                    self._stop(name)
+                self._executor = None
+
+
+class _MirrorAction(argparse.Action):
+    """``--mirror URL`` adds a mirror to the source given by the preceding ``--url``."""
+
+    def __call__(self, parser: argparse.ArgumentParser, namespace: argparse.Namespace, values: Any, option_string: Any = None) -> None:
+        urls = getattr(namespace, "url", None)
+        if not urls:
+            parser.error("--mirror 需要跟在某个 --url 之后")
+        urls[-1] = source_mirrors(urls[-1]) + [values]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="将通用订阅（ss/vmess/trojan/ssr）转换为 Clash 兼容的 YAML 配置"
+    )
+    parser.add_argument(
+        "--url",
+        action="append",
+        default=[],
+        help="订阅链接，或本地文件路径（也可用 file:/// 形式）；可重复指定多个，节点按顺序合并",
+    )
+    parser.add_argument(
+        "--mirror",
+        action=_MirrorAction,
+        help="为前一个 --url 添加镜像地址（可重复），多个镜像同时竞速，取最先成功响应的一个",
+    )
+    parser.add_argument(
+        "--hedge-delay",
+        type=float,
+        default=0.0,
+        help="镜像竞速时，依次启动下一个镜像前等待的秒数（默认 0 表示同时请求）",
+    )
+    parser.add_argument(
+        "--sources-file",
+        help="订阅源列表文件，每行一个链接或本地路径，# 开头为注释；同一行以空格分隔的多个链接视为镜像",
     )
-    parser.add_argument("--url", required=True, help="订阅链接，或本地文件路径（也可用 file:/// 形式）")
+    parser.add_argument("--retries", type=int, default=2, help="拉取失败（连接错误、超时、429/5xx）时的重试次数")
+    parser.add_argument("--retry-backoff", type=float, default=1.0, help="重试的初始退避秒数，每次翻倍并加入随机抖动")
+    parser.add_argument("--per-host-limit", type=int, default=2, help="多订阅源并发拉取时，每个主机的最大并发数")
     parser.add_argument("--output", default="clash.yaml", help="输出的 Clash 配置文件路径")
     parser.add_argument("--name", default="MySubscription", help="配置名，仅用于内部标识")
     parser.add_argument(
@@ -452,29 +3455,359 @@ def main() -> None:
         default=0,
         help="设置>0则开启定时自动更新（分钟）。默认0表示只执行一次",
     )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="定时更新的随机抖动，占间隔的比例（如 0.1 表示每次提前或推迟至多 10%%），避免多台机器同时拉取",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="自适应间隔：订阅连续未变化或拉取失败时逐次将间隔加倍，内容变化后恢复 --interval-minutes",
+    )
+    parser.add_argument(
+        "--max-interval-minutes",
+        type=float,
+        default=0,
+        help="--adaptive 时间隔的上限（分钟，默认为 --interval-minutes 的 8 倍）",
+    )
     parser.add_argument(
         "--clash-meta",
         action="store_true",
         help="开启后原生输出 SSR 节点（type:ssr，需 Clash Meta 客户端）",
     )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"本地缓存目录，用于 ETag/Last-Modified 条件请求（默认 {DEFAULT_CACHE_DIR}）",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="禁用本地缓存，每次完整拉取并转换")
+    parser.add_argument(
+        "--parse-cache-size",
+        type=int,
+        default=50000,
+        help="逐行解析缓存的最大条目数（LRU 淘汰），0 表示禁用",
+    )
+    parser.add_argument(
+        "--yaml-emitter",
+        choices=YAML_EMITTERS,
+        default="auto",
+        help="YAML 输出方式：auto 在结果逐字节一致时使用 libyaml 加速；libyaml 始终使用（emoji 等会转义）；python 为纯 Python",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="流式处理：分块下载、逐行解码解析，并不经过 PyYAML 逐个节点直接写出 YAML（内存占用与订阅大小无关）",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=f"解析进程数（0 表示按 CPU 核数）；不足 {PARALLEL_PARSE_MIN_LINES} 行的订阅自动退回单进程解析",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="只保留名称匹配的节点；关键字或正则，可重复指定，匹配任一即保留",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="丢弃名称匹配的节点（如 过期、剩余流量、官网）；关键字或正则，可重复指定",
+    )
+    parser.add_argument(
+        "--dedupe",
+        choices=DEDUPE_POLICIES,
+        default="first",
+        help="合并服务器、端口、凭据与传输方式均相同的重复节点，并决定保留哪个名称："
+        "first 最先出现（默认）、last 最后出现、shortest 最短、longest 最长；off 不合并",
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help="并发测量各节点 TCP 连接延迟：选择组按延迟排序，并添加由最快节点组成的自动选择组 Auto",
+    )
+    parser.add_argument("--probe-timeout", type=float, default=2.0, help="单个节点的连接超时秒数（默认 2）")
+    parser.add_argument("--probe-deadline", type=float, default=15.0, help="整轮测速的总时限秒数，超时未完成的视为不可用（默认 15）")
+    parser.add_argument("--probe-concurrency", type=int, default=64, help="同时进行的连接测试数（默认 64）")
+    parser.add_argument(
+        "--auto-group",
+        choices=AUTO_GROUP_TYPES,
+        default="url-test",
+        help="自动选择组类型：url-test 选最快，fallback 按顺序取第一个可用（默认 url-test）",
+    )
+    parser.add_argument("--auto-size", type=int, default=10, help="自动选择组包含的最快节点数（默认 10）")
+    parser.add_argument("--timings", action="store_true", help="每次转换结束后输出各阶段耗时（墙钟/CPU）及字节、行、节点数")
+    parser.add_argument("--profile", metavar="OUT.prof", help="用 cProfile 记录整个运行过程，退出时写入该文件")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="监视本地订阅文件（Linux 上使用 inotify，其他平台定时检查），文件变化后立即重新转换；"
+        "同时设置 --interval-minutes 时也会按间隔定期转换",
+    )
+    parser.add_argument("--watch-debounce", type=float, default=0.5, help="文件连续变化时，等待静止多少秒后再转换（默认 0.5）")
+    parser.add_argument(
+        "--daemon",
+        metavar="CONFIG",
+        help="守护进程模式：按 JSON 配置文件同时维护多个订阅，各自的输出、间隔与选项见 README；"
+        "命令行中的缓存、网络与解析选项作为所有订阅的默认值",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="HOST:PORT",
+        help="以 HTTP 服务方式在内存中提供转换后的配置（支持 ETag 与 gzip），不写入 --output；"
+        "配置超过 --interval-minutes（未设置时为 5 分钟）后在下次请求时刷新",
+    )
     args = parser.parse_args()
 
+    try:
+        sources = load_sources(args)
+    except OSError as e:
+        parser.error(f"无法读取订阅源列表文件: {e}")
+    if not sources and not args.daemon:
+        parser.error("请通过 --url 或 --sources-file 指定至少一个订阅源")
+    if args.stream and args.probe:
+        parser.error("--probe 需要拿到全部节点后才能排序，不能与 --stream 同时使用")
+    if args.stream and args.dedupe not in ("first", "off"):
+        parser.error("--stream 模式下节点边解析边写出，--dedupe 只能为 first 或 off")
+
+    configure_http(
+        retries=max(0, args.retries),
+        backoff=max(0.0, args.retry_backoff),
+        pool_size=max(10, args.per_host_limit),
+        hedge_delay=max(0.0, args.hedge_delay),
+    )
+
+    run_kwargs: Dict[str, Any] = {
+        "allow_native_ssr": args.clash_meta,
+        "cache_dir": None if args.no_cache else args.cache_dir,
+        "parse_cache_size": args.parse_cache_size,
+        "yaml_emitter": args.yaml_emitter,
+        "stream": args.stream,
+        "per_host_limit": args.per_host_limit,
+        "timings": args.timings,
+        "workers": max(0, args.workers),
+        "dedupe": args.dedupe,
+        "include": args.include,
+        "exclude": args.exclude,
+        "probe": ProbeSettings(
+            timeout=max(0.1, args.probe_timeout),
+            deadline=max(0.1, args.probe_deadline),
+            concurrency=max(1, args.probe_concurrency),
+            group_type=args.auto_group,
+            group_size=max(1, args.auto_size),
+        )
+        if args.probe
+        else None,
+    }
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        _run_mode(parser, args, sources, run_kwargs)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"性能分析数据已写入 {args.profile}（可用 python -m pstats 查看）", file=sys.stderr)
+
+
+def _run_mode(
+    parser: argparse.ArgumentParser,
+    args: argparse.Namespace,
+    sources: List[Source],
+    run_kwargs: Dict[str, Any],
+) -> None:
     interval = args.interval_minutes
+    if args.daemon:
+        _daemon_main(parser, args, run_kwargs)
+    if args.serve:
+        try:
+            host, port = parse_host_port(args.serve)
+        except ValueError as e:
+            parser.error(str(e))
+        serve_kwargs = {k: v for k, v in run_kwargs.items() if k not in ("stream", "timings")}
+        server = ConfigServer(sources, args.name, max_age=interval * 60 if interval > 0 else 300.0, **serve_kwargs)
+        if server.get() is None:
+            print("首次转换失败，将在收到请求时重试。", file=sys.stderr)
+
+        def refresh() -> None:
+            reload, run_now = signals.take()
+            if reload:
+                server.sources = _reload_sources(args, server.sources)
+            if reload or run_now:
+                server.get(force=True)
+
+        # the accept loop runs on this thread, so the conversion happens on another one
+        signals = RefreshSignals(wake=lambda: threading.Thread(target=refresh, daemon=True).start())
+        print(f"已在 http://{args.serve} 提供 Clash 配置。按 Ctrl+C 停止。")
+        if signals.install():
+            print(f"发送 SIGHUP 重新读取订阅源列表，SIGUSR1 立即刷新配置（进程号 {os.getpid()}）。")
+        try:
+            server.serve_forever(host, port)
+        except KeyboardInterrupt:
+            print("收到中断指令，已停止服务。")
+        sys.exit(0)
+    if args.watch:
+        if _watch_paths(sources) is None:
+            parser.error("--watch 只适用于本地订阅文件")
+        _watch_loop(sources, args, run_kwargs)
     if not interval or interval <= 0:
-        code = run_once(args.url, args.output, args.name, allow_native_ssr=args.clash_meta)
+        code = run_once(sources, args.output, args.name, **run_kwargs)
         sys.exit(code)
     else:
+        scheduler = _make_scheduler(args)
+        signals = RefreshSignals()
         print(f"已开启自动更新：每 {interval} 分钟拉取并覆盖 {args.output}。按 Ctrl+C 停止。")
+        if signals.install():
+            print(f"发送 SIGHUP 重新读取订阅源列表，SIGUSR1 立即更新一次（进程号 {os.getpid()}）。")
         try:
             while True:
-                code = run_once(args.url, args.output, args.name, allow_native_ssr=args.clash_meta)
+                signals.wait(scheduler.remaining())
+                reload, run_now = signals.take()
+                if reload:
+                    sources = _reload_sources(args, sources)
+                on_schedule = scheduler.remaining() <= 0
+                if not (on_schedule or reload or run_now):
+                    continue
+                before = _output_signature(args.output)
+                code = run_once(sources, args.output, args.name, **run_kwargs)
                 # 不因单次失败中断循环，等待后继续
-                time.sleep(max(1, int(interval * 60)))
+                if on_schedule:
+                    _record_run(scheduler, run_outcome(code, before, args.output))
         except KeyboardInterrupt:
             print("收到中断指令，已停止自动更新。")
             sys.exit(0)
 
 
+def _daemon_main(parser: argparse.ArgumentParser, args: argparse.Namespace, run_kwargs: Dict[str, Any]) -> None:
+    try:
+        concurrency, jobs = load_daemon_config(args.daemon, run_kwargs)
+    except (OSError, ValueError) as e:
+        parser.error(f"无法加载守护进程配置 {args.daemon}: {e}")
+    # every conversion thread may hold per_host_limit connections to the same host
+    configure_http(pool_size=max(10, concurrency * args.per_host_limit))
+    daemon = Daemon(jobs, run_kwargs, concurrency)
+
+    def reload() -> None:
+        try:
+            new_concurrency, new_jobs = load_daemon_config(args.daemon, run_kwargs)
+        except (OSError, ValueError) as e:
+            print(f"[{_now()}] 重新加载 {args.daemon} 失败，继续使用原配置: {e}", file=sys.stderr)
+            return
+        added, changed, removed = daemon.reload(new_jobs)
+        print(f"[{_now()}] 已重新加载配置：新增 {added} 个、修改 {changed} 个、移除 {removed} 个订阅。")
+        if new_concurrency != daemon.concurrency:
+            print(f"[{_now()}] concurrency 的修改需要重启后生效（当前为 {daemon.concurrency}）。", file=sys.stderr)
+
+    async def serve() -> None:
+        loop = asyncio.get_running_loop()
+        if hasattr(signal, "SIGHUP") and hasattr(signal, "SIGUSR1"):
+            loop.add_signal_handler(signal.SIGHUP, reload)
+            loop.add_signal_handler(signal.SIGUSR1, daemon.run_now)
+        await daemon.run()
+
+    print(f"已启动守护进程：{len(jobs)} 个订阅，最多同时转换 {concurrency} 个。按 Ctrl+C 停止。")
+    if hasattr(signal, "SIGHUP"):
+        print(f"发送 SIGHUP 重新加载配置，SIGUSR1 立即转换全部订阅（进程号 {os.getpid()}）。")
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("收到中断指令，已停止守护进程。")
+    sys.exit(0)
+
+
+def load_sources(args: argparse.Namespace) -> List[Source]:
+    """Sources named on the command line, followed by those in ``--sources-file``."""
+    sources: List[Source] = list(args.url)
+    if args.sources_file:
+        sources.extend(read_sources_file(args.sources_file))
+    return sources
+
+
+def _reload_sources(args: argparse.Namespace, sources: List[Source]) -> List[Source]:
+    try:
+        reloaded = load_sources(args)
+    except OSError as e:
+        print(f"[{_now()}] 重新读取订阅源列表失败，继续使用原列表: {e}", file=sys.stderr)
+        return sources
+    if not reloaded:
+        print(f"[{_now()}] 订阅源列表为空，继续使用原列表。", file=sys.stderr)
+        return sources
+    print(f"[{_now()}] 已重新读取订阅源列表：{len(reloaded)} 个订阅源。")
+    return reloaded
+
+
+def _make_scheduler(args: argparse.Namespace) -> RefreshScheduler:
+    return RefreshScheduler(
+        max(1.0, args.interval_minutes * 60),
+        jitter=args.jitter,
+        adaptive=args.adaptive,
+        max_interval=args.max_interval_minutes * 60 if args.max_interval_minutes > 0 else None,
+    )
+
+
+def _record_run(scheduler: RefreshScheduler, outcome: str) -> None:
+    previous = scheduler.period
+    period = scheduler.record(outcome)
+    if period != previous:
+        print(f"[{_now()}] 更新间隔调整为 {period / 60:g} 分钟")
+
+
+def _watch_paths(sources: List[Source]) -> Optional[List[str]]:
+    paths = [local_source_path(src) for src in sources]
+    return [p for p in paths if p] if all(paths) else None
+
+
+def _watch_loop(sources: List[Source], args: argparse.Namespace, run_kwargs: Dict[str, Any]) -> None:
+    interval = args.interval_minutes
+    paths = _watch_paths(sources) or []
+    watcher = FileWatcher(paths, debounce=max(0.0, args.watch_debounce))
+    signals = RefreshSignals(wake=lambda: watcher.wakeup())
+    print(f"已开启文件监视（{watcher.backend}）：{', '.join(paths)} 变化后重新生成 {args.output}。按 Ctrl+C 停止。")
+    if signals.install():
+        print(f"发送 SIGHUP 重新读取订阅源列表，SIGUSR1 立即更新一次（进程号 {os.getpid()}）。")
+    scheduler = _make_scheduler(args) if interval > 0 else None
+    try:
+        run_once(sources, args.output, args.name, **run_kwargs)
+        if scheduler is not None:
+            scheduler.record(RUN_CHANGED)
+        while True:
+            changed = watcher.wait(timeout=scheduler.remaining() if scheduler is not None else None)
+            reload, run_now = signals.take()
+            if reload:
+                reloaded = _reload_sources(args, sources)
+                new_paths = _watch_paths(reloaded)
+                if new_paths is None:
+                    print(f"[{_now()}] --watch 只适用于本地订阅文件，继续使用原列表。", file=sys.stderr)
+                else:
+                    sources = reloaded
+                    if new_paths != paths:
+                        paths = new_paths
+                        watcher.close()
+                        watcher = FileWatcher(paths, debounce=max(0.0, args.watch_debounce))
+            on_schedule = scheduler is not None and scheduler.remaining() <= 0
+            if not (changed or reload or run_now or on_schedule):
+                continue
+            if changed:
+                print(f"[{_now()}] 检测到文件变化：{', '.join(changed)}")
+            before = _output_signature(args.output)
+            code = run_once(sources, args.output, args.name, **run_kwargs)
+            if scheduler is not None and on_schedule:
+                _record_run(scheduler, run_outcome(code, before, args.output))
+    except KeyboardInterrupt:
+        print("收到中断指令，已停止文件监视。")
+    finally:
+        watcher.close()
+    sys.exit(0)
+
+
 if __name__ == "__main__":
     main()
 
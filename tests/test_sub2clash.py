@@ -0,0 +1,780 @@
+"""Regression tests for sub2clash, run against local stand-in servers.
+
+    python -m unittest discover tests
+"""
+
+import contextlib
+import http.server
+import io
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sub2clash  # noqa: E402
+
+# status, headers, body
+Reply = Tuple[int, Dict[str, str], bytes]
+
+SUBSCRIPTION = "\n".join(
+    [
+        "ss://aes-256-gcm:pw@hk1.example.com:443#HK%201",
+        "ss://aes-256-gcm:pw@hk2.example.com:443#HK%202",
+        "trojan://pw@jp1.example.com:443#JP%201",
+        # only rendered as a node with allow_native_ssr (--clash-meta)
+        "ssr://"
+        + sub2clash.base64.urlsafe_b64encode(
+            b"sg1.example.com:8388:auth_aes128_md5:aes-256-cfb:http_simple:"
+            + sub2clash.base64.urlsafe_b64encode(b"pw").rstrip(b"=")
+            + b"/?remarks="
+            + sub2clash.base64.urlsafe_b64encode("SG 1".encode("utf-8")).rstrip(b"=")
+        )
+        .rstrip(b"=")
+        .decode("ascii"),
+    ]
+).encode("utf-8")
+
+
+class StandInServer:
+    """Local HTTP server whose replies come from ``routes``: path -> handler(request headers) -> Reply."""
+
+    def __init__(self) -> None:
+        self.routes: Dict[str, Callable[[Dict[str, str]], Reply]] = {}
+        self.log: List[Tuple[str, int]] = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                route = server.routes.get(self.path)
+                status, headers, body = route(dict(self.headers)) if route else (404, {}, b"")
+                server.log.append((self.path, status))
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    def statuses(self, path: str) -> List[int]:
+        return [status for p, status in self.log if p == path]
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def etag_route(body: bytes, etag: str = '"v1"') -> Callable[[Dict[str, str]], Reply]:
+    def route(headers: Dict[str, str]) -> Reply:
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag}, body
+
+    return route
+
+
+class StandInTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = StandInServer()
+        self.addCleanup(self.server.close)
+        self.tmp = tempfile.mkdtemp(prefix="sub2clash-test-")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.cache_dir = os.path.join(self.tmp, "cache")
+        sub2clash.configure_http(retries=0, backoff=0.01, hedge_delay=0.0)
+        self.addCleanup(sub2clash.configure_http, **sub2clash.HttpPolicy().__dict__)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmp, name)
+
+    def run_once(self, url: str, output: str, **kwargs: object) -> Tuple[int, str]:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            code = sub2clash.run_once(url, output, "test", cache_dir=self.cache_dir, **kwargs)
+        return code, out.getvalue()
+
+
+def read(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class ConditionalFetchTest(StandInTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.server.routes["/sub"] = etag_route(SUBSCRIPTION)
+        self.url = self.server.url("/sub")
+
+    def test_304_reuses_cached_body(self) -> None:
+        first = sub2clash.fetch_subscription(self.url, cache_dir=self.cache_dir)
+        second = sub2clash.fetch_subscription(self.url, cache_dir=self.cache_dir)
+        self.assertFalse(first.not_modified)
+        self.assertTrue(second.not_modified)
+        self.assertEqual(second.raw, SUBSCRIPTION)
+        self.assertEqual(self.server.statuses("/sub"), [200, 304])
+
+    def test_unchanged_rerun_skips_conversion(self) -> None:
+        output = self.path("a.yaml")
+        self.assertEqual(self.run_once(self.url, output)[0], 0)
+        mtime = os.stat(output).st_mtime_ns
+        code, log = self.run_once(self.url, output)
+        self.assertEqual(code, 0)
+        self.assertIn("跳过转换", log)
+        self.assertEqual(os.stat(output).st_mtime_ns, mtime)
+
+    def test_304_still_converts_when_options_change(self) -> None:
+        for stream in (False, True):
+            with self.subTest(stream=stream):
+                output = self.path(f"options-{stream}.yaml")
+                self.run_once(self.url, output, stream=stream)
+                self.assertNotIn("SG 1", read(output))
+                self.assertEqual(self.run_once(self.url, output, stream=stream, allow_native_ssr=True)[0], 0)
+                self.assertIn("SG 1", read(output))
+                self.assertEqual(self.run_once(self.url, output, stream=stream, exclude=["HK"])[0], 0)
+                self.assertNotIn("HK 1", read(output))
+                self.assertEqual(self.server.statuses("/sub")[-1], 304)
+
+    def test_304_still_writes_another_output(self) -> None:
+        self.run_once(self.url, self.path("a.yaml"))
+        other = self.path("b.yaml")
+        with open(other, "w", encoding="utf-8") as f:
+            f.write("old: 1\n")
+        self.assertEqual(self.run_once(self.url, other)[0], 0)
+        self.assertEqual(self.server.statuses("/sub"), [200, 304])
+        self.assertEqual(read(other), read(self.path("a.yaml")))
+
+    def test_serve_rerenders_on_304_when_options_change(self) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = sub2clash.ConfigServer([self.url], "test", max_age=0, cache_dir=self.cache_dir)
+            first = server.get()
+            server.exclude = ["HK"]
+            second = server.get()
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIn(b"HK 1", first.body)
+        self.assertNotIn(b"HK 1", second.body)
+        self.assertEqual(self.server.statuses("/sub"), [200, 304])
+
+    def test_concurrent_fetches_leave_one_complete_cache_entry(self) -> None:
+        bodies: List[bytes] = []
+
+        def fetch(stream: bool) -> None:
+            if stream:
+                bodies.append(b"".join(sub2clash.stream_subscription(self.url, cache_dir=self.cache_dir).chunks))
+            else:
+                bodies.append(sub2clash.fetch_subscription(self.url, cache_dir=self.cache_dir).raw)
+
+        # always a full 200 with validators, so every fetch rewrites the cache entry
+        self.server.routes["/sub"] = lambda headers: (200, {"ETag": '"v1"'}, SUBSCRIPTION)
+        threads = [threading.Thread(target=fetch, args=(i % 2 == 0,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(bodies, [SUBSCRIPTION] * 8)
+        fetch_dir = os.path.join(self.cache_dir, "fetch")
+        self.assertEqual(sorted(os.path.splitext(name)[1] for name in os.listdir(fetch_dir)), [".body", ".json"])
+        meta, body = sub2clash._load_fetch_cache(self.cache_dir, self.url)
+        self.assertEqual((meta["etag"], body), ('"v1"', SUBSCRIPTION))
+
+
+class StreamWriteTest(StandInTestCase):
+    def test_unwritable_output_fails_and_closes_the_fetch(self) -> None:
+        self.server.routes["/sub"] = etag_route(SUBSCRIPTION)
+        opened: List["sub2clash.FetchStream"] = []
+
+        def stream_subscription(*args: object, **kwargs: object) -> "sub2clash.FetchStream":
+            opened.append(real(*args, **kwargs))
+            return opened[-1]
+
+        real = sub2clash.stream_subscription
+        output = self.path(os.path.join("missing", "x.yaml"))
+        with mock.patch.object(sub2clash, "stream_subscription", stream_subscription):
+            code, log = self.run_once(self.server.url("/sub"), output, stream=True)
+        self.assertEqual(code, 4)
+        self.assertIn("写入 YAML 失败", log)
+        self.assertFalse(os.path.exists(output))
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].response.raw.closed)
+
+
+def flaky_route(
+    body: bytes, failures: int, status: int = 503, headers: Optional[Dict[str, str]] = None
+) -> Callable[[Dict[str, str]], Reply]:
+    """Fail the first ``failures`` requests with ``status``, then serve ``body``."""
+    remaining = [failures]
+
+    def route(_headers: Dict[str, str]) -> Reply:
+        if remaining[0] > 0:
+            remaining[0] -= 1
+            return status, dict(headers or {}), b"busy"
+        return 200, {}, body
+
+    return route
+
+
+class RetryTest(StandInTestCase):
+    def test_retries_503_then_succeeds(self) -> None:
+        self.server.routes["/sub"] = flaky_route(SUBSCRIPTION, failures=2)
+        sub2clash.configure_http(retries=2, backoff=0.01)
+        result = sub2clash.fetch_subscription(self.server.url("/sub"))
+        self.assertEqual(result.raw, SUBSCRIPTION)
+        self.assertEqual(self.server.statuses("/sub"), [503, 503, 200])
+
+    def test_gives_up_after_retries(self) -> None:
+        self.server.routes["/sub"] = flaky_route(SUBSCRIPTION, failures=5)
+        sub2clash.configure_http(retries=1, backoff=0.01)
+        with self.assertRaises(Exception):
+            sub2clash.fetch_subscription(self.server.url("/sub"))
+        self.assertEqual(self.server.statuses("/sub"), [503, 503])
+
+    def test_honours_retry_after(self) -> None:
+        self.server.routes["/sub"] = flaky_route(SUBSCRIPTION, failures=1, status=429, headers={"Retry-After": "1"})
+        sub2clash.configure_http(retries=1, backoff=0.01)
+        t0 = time.monotonic()
+        sub2clash.fetch_subscription(self.server.url("/sub"))
+        self.assertGreaterEqual(time.monotonic() - t0, 0.9)
+
+    def test_run_once_survives_a_flaky_server(self) -> None:
+        self.server.routes["/sub"] = flaky_route(SUBSCRIPTION, failures=1)
+        sub2clash.configure_http(retries=2, backoff=0.01)
+        output = self.path("a.yaml")
+        self.assertEqual(self.run_once(self.server.url("/sub"), output)[0], 0)
+        self.assertIn("HK 1", read(output))
+
+
+def slow_route(body: bytes, delay: float, status: int = 200) -> Callable[[Dict[str, str]], Reply]:
+    def route(_headers: Dict[str, str]) -> Reply:
+        time.sleep(delay)
+        return status, {}, body
+
+    return route
+
+
+class MirrorRaceTest(StandInTestCase):
+    def wait_for(self, predicate: Callable[[], bool], timeout: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.02)
+
+    def test_fast_mirror_wins_and_slow_one_is_closed(self) -> None:
+        self.server.routes["/slow"] = slow_route(b"slow", 0.8)
+        self.server.routes["/fast"] = slow_route(SUBSCRIPTION, 0.0)
+        slow, fast = self.server.url("/slow"), self.server.url("/fast")
+        result = sub2clash.fetch_subscription([slow, fast])
+        self.assertEqual((result.url, result.raw), (fast, SUBSCRIPTION))
+        self.wait_for(lambda: sub2clash.mirror_stats().get(slow, sub2clash.MirrorStats()).losses == 1)
+        self.assertEqual(sub2clash.mirror_stats()[fast].wins, 1)
+
+    def test_failed_mirror_fires_the_next_at_once(self) -> None:
+        sub2clash.configure_http(hedge_delay=30.0)
+        self.server.routes["/down"] = slow_route(b"", 0.0, status=500)
+        self.server.routes["/up"] = slow_route(SUBSCRIPTION, 0.0)
+        down, up = self.server.url("/down"), self.server.url("/up")
+        t0 = time.monotonic()
+        result = sub2clash.fetch_subscription([down, up])
+        self.assertLess(time.monotonic() - t0, 5.0)
+        self.assertEqual(result.url, up)
+        self.assertEqual(sub2clash.mirror_stats()[down].failures, 1)
+
+    def test_later_mirrors_untouched_when_first_answers_in_time(self) -> None:
+        sub2clash.configure_http(hedge_delay=5.0)
+        self.server.routes["/a"] = slow_route(SUBSCRIPTION, 0.0)
+        self.server.routes["/b"] = slow_route(SUBSCRIPTION, 0.0)
+        result = sub2clash.fetch_subscription([self.server.url("/a"), self.server.url("/b")])
+        self.assertEqual(result.url, self.server.url("/a"))
+        self.assertEqual(self.server.statuses("/b"), [])
+
+    def test_all_mirrors_failing_raises(self) -> None:
+        self.server.routes["/x"] = slow_route(b"", 0.0, status=500)
+        self.server.routes["/y"] = slow_route(b"", 0.0, status=502)
+        with self.assertRaises(Exception):
+            sub2clash.fetch_subscription([self.server.url("/x"), self.server.url("/y")])
+        self.assertEqual(sorted(self.server.statuses("/x") + self.server.statuses("/y")), [500, 502])
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.mkdtemp(prefix="sub2clash-test-")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.output = os.path.join(self.tmp, "clash.yaml")
+
+    def leftovers(self) -> List[str]:
+        return [name for name in os.listdir(self.tmp) if name != "clash.yaml"]
+
+    def stage(self, text: str) -> str:
+        tmp_path = sub2clash.temp_output_path(self.output)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return tmp_path
+
+    def test_identical_bytes_leave_the_file_alone(self) -> None:
+        self.assertTrue(sub2clash.commit_output(self.stage("a: 1\n"), self.output))
+        before = os.stat(self.output)
+        self.assertFalse(sub2clash.commit_output(self.stage("a: 1\n"), self.output))
+        after = os.stat(self.output)
+        self.assertEqual((before.st_ino, before.st_mtime_ns), (after.st_ino, after.st_mtime_ns))
+        self.assertEqual(self.leftovers(), [])
+
+    def test_changed_bytes_are_renamed_over_keeping_the_mode(self) -> None:
+        sub2clash.commit_output(self.stage("a: 1\n"), self.output)
+        os.chmod(self.output, 0o640)
+        inode = os.stat(self.output).st_ino
+        self.assertTrue(sub2clash.commit_output(self.stage("a: 2\n"), self.output))
+        self.assertEqual(read(self.output), "a: 2\n")
+        self.assertNotEqual(os.stat(self.output).st_ino, inode)
+        self.assertEqual(os.stat(self.output).st_mode & 0o777, 0o640)
+        self.assertEqual(self.leftovers(), [])
+
+    @unittest.skipIf(sub2clash.yaml is None, "PyYAML is not installed")
+    def test_write_yaml_to_file_reports_no_op(self) -> None:
+        config = {"proxies": [{"name": "HK 1", "port": 443}]}
+        self.assertTrue(sub2clash.write_yaml_to_file(config, self.output))
+        self.assertFalse(sub2clash.write_yaml_to_file(config, self.output))
+        self.assertEqual(self.leftovers(), [])
+
+
+def parse_vless(line: str, allow_native_ssr: bool) -> Optional[Dict[str, object]]:
+    """Stand-in plugin parser; module level so pool workers can unpickle it."""
+    u = sub2clash.urlsplit(line)
+    if not u.hostname or not u.port:
+        return None
+    return {"name": sub2clash.unquote(u.fragment), "type": "vless", "server": u.hostname, "port": u.port, "uuid": u.username}
+
+
+class ParallelParseTest(unittest.TestCase):
+    def parse(self, lines: List[str], workers: int) -> List[Tuple[Optional[Dict[str, object]], Optional[str]]]:
+        return [
+            (p.to_clash() if p else None, warning)
+            for p, warning in sub2clash.iter_parsed_lines_parallel(lines, workers=workers)
+        ]
+
+    def test_registered_parser_reaches_the_workers(self) -> None:
+        self.addCleanup(sub2clash.shutdown_parse_pool)
+        lines = [f"vless://id-{i}@n{i}.example.com:443#VL%20{i}" for i in range(25000)]
+        lines[7] = "vless://broken"
+        for parser in (parse_vless, lambda line, allow_native_ssr: parse_vless(line, allow_native_ssr)):
+            with self.subTest(picklable=parser is parse_vless):
+                sub2clash.register_parser("vless", parser)
+                self.addCleanup(sub2clash.PARSERS.pop, "vless", None)
+                serial = self.parse(lines, workers=1)
+                self.assertEqual(serial[0][0]["server"], "n0.example.com")
+                self.assertIsNotNone(serial[7][1])
+                self.assertEqual(self.parse(lines, workers=2), serial)
+
+
+class ParseCacheTest(unittest.TestCase):
+    LINE = "ss://aes-256-gcm:pw@hk1.example.com:443#HK%201"
+
+    def test_corrupt_entry_is_dropped_and_reparsed(self) -> None:
+        cache = sub2clash.ParseCache()
+        list(sub2clash.iter_parsed_lines([self.LINE], cache=cache))
+        key = cache._key(self.LINE, False)
+        cache._entries[key] = b"not a pickle"
+        self.assertIsNone(cache.get(self.LINE))
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 2, 0))
+        parsed = list(sub2clash.iter_parsed_lines([self.LINE], cache=cache))
+        self.assertEqual(parsed[0][0].name, "HK 1")
+        self.assertEqual(cache.get(self.LINE).name, "HK 1")
+
+    def test_file_from_another_build_is_ignored(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "parse.pickle")
+            cache = sub2clash.ParseCache(path)
+            cache.put(self.LINE, False, sub2clash.parse_ss(self.LINE))
+            cache.save()
+            self.assertEqual(len(sub2clash.ParseCache(path)), 1)
+            with mock.patch.object(sub2clash, "_code_fingerprint", lambda: "upgraded"):
+                self.assertEqual(len(sub2clash.ParseCache(path)), 0)
+
+
+class DedupeTest(unittest.TestCase):
+    def nodes(self) -> List["sub2clash.Proxy"]:
+        return [
+            sub2clash.SSProxy("HK 01", "hk.example.com", 443, "aes-256-gcm", "pw"),
+            sub2clash.SSProxy("JP", "jp.example.com", 443, "aes-256-gcm", "pw"),
+            sub2clash.SSProxy("香港", "HK.Example.COM", 443, "aes-256-gcm", "pw"),
+            sub2clash.SSProxy("Hong Kong 1", "hk.example.com", 443, "aes-256-gcm", "pw"),
+            sub2clash.SSProxy("HK other port", "hk.example.com", 8443, "aes-256-gcm", "pw"),
+        ]
+
+    def test_each_policy_picks_its_name(self) -> None:
+        expected = {
+            "first": ["HK 01", "JP", "HK other port"],
+            "last": ["Hong Kong 1", "JP", "HK other port"],
+            "shortest": ["香港", "JP", "HK other port"],
+            "longest": ["Hong Kong 1", "JP", "HK other port"],
+        }
+        for policy, names in expected.items():
+            with self.subTest(policy=policy):
+                kept, collapsed = sub2clash.dedupe_proxies(self.nodes(), policy)
+                self.assertEqual([p.name for p in kept], names)
+                self.assertEqual(collapsed, 2)
+        kept, collapsed = sub2clash.dedupe_proxies(self.nodes(), "off")
+        self.assertEqual((len(kept), collapsed), (5, 0))
+        with self.assertRaises(ValueError):
+            sub2clash.dedupe_proxies(self.nodes(), "newest")
+
+    def test_transports_stay_distinct(self) -> None:
+        def vmess(name: str, **transport: object) -> "sub2clash.Proxy":
+            return sub2clash.VmessProxy(name, "v.example.com", 443, "id", tls=True, **transport)  # type: ignore[arg-type]
+
+        nodes = [
+            vmess("tcp"),
+            vmess("ws", network="ws", ws_path="/a"),
+            vmess("ws other path", network="ws", ws_path="/b"),
+            vmess("grpc", network="grpc", grpc_service="svc"),
+            vmess("ws again", network="ws", ws_path="/a"),
+            vmess("grpc again", network="grpc", grpc_service="svc"),
+            sub2clash.TrojanProxy("trojan ws", "V.example.com", 443, "pw", network="ws", ws_path="/a"),
+            sub2clash.TrojanProxy("trojan grpc", "v.example.com", 443, "pw", network="grpc", grpc_service="svc"),
+        ]
+        kept, collapsed = sub2clash.dedupe_proxies(nodes)
+        self.assertEqual([p.name for p in kept], ["tcp", "ws", "ws other path", "grpc", "trojan ws", "trojan grpc"])
+        self.assertEqual(collapsed, 2)
+        self.assertEqual(len({sub2clash.identity_digest(p) for p in nodes}), 6)
+
+
+class UniqueNamesTest(unittest.TestCase):
+    def test_many_identical_names_stay_unique_and_in_order(self) -> None:
+        count = 100000
+        proxies = [sub2clash.SSProxy("SS", f"ss{i}.example.com", 443, "aes-256-gcm", "pw") for i in range(count)]
+        self.assertEqual(sub2clash.ensure_unique_names(proxies), count - 1)
+        names = [p.name for p in proxies]
+        self.assertEqual(len(set(names)), count)
+        self.assertEqual(names[:3], ["SS", "SS 2", "SS 3"])
+        self.assertEqual(names[-1], f"SS {count}")
+
+    def test_reserved_and_taken_suffixes_are_skipped(self) -> None:
+        names = sub2clash.UniqueNames(sub2clash.RESERVED_PROXY_NAMES + (sub2clash.AUTO_GROUP_NAME,))
+        claimed = [names.claim(n) for n in ["DIRECT", "REJECT", "Proxy", "Auto", "SS 2", "SS", "SS", "SS", "SS 2"]]
+        self.assertEqual(
+            claimed, ["DIRECT 2", "REJECT 2", "Proxy 2", "Auto 2", "SS 2", "SS", "SS 3", "SS 4", "SS 2 2"]
+        )
+        self.assertEqual(names.renamed, 7)
+        self.assertEqual(sub2clash.UniqueNames().claim("Auto"), "Auto")
+
+
+class TimingsTest(unittest.TestCase):
+    def test_scheme_counts_cover_only_the_current_run(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "nodes.txt")
+            with open(source, "w", encoding="utf-8") as f:
+                f.write("ss://aes-256-gcm:pw@hk1.example.com:443#HK%201\ntrojan://pw@jp1.example.com:443#JP%201\n")
+            for run in (1, 2):
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+                    code = sub2clash.run_once(source, os.path.join(tmp, "a.yaml"), "test", timings=True)
+                with self.subTest(run=run):
+                    self.assertEqual(code, 0)
+                    self.assertIn("协议：ss 1/1  trojan 1/1\n", out.getvalue())
+
+
+class NameFilterTest(unittest.TestCase):
+    def test_backreferences_survive_other_patterns(self) -> None:
+        for include in ([r"^(HK|JP)-\d+", r"(\w)\1"], [r"(\w)\1", r"^(HK|JP)-\d+"]):
+            with self.subTest(include=include):
+                name_filter = sub2clash.NameFilter(include)
+                self.assertTrue(name_filter.accepts("aa-node"))
+                self.assertTrue(name_filter.accepts("HK-1"))
+                self.assertFalse(name_filter.accepts("xy"))
+
+    def test_repeated_group_names_and_keywords(self) -> None:
+        name_filter = sub2clash.NameFilter([r"(?P<r>HK)\b", r"(?P<r>JP)\b", "香港"], ["过期", "(?i)expire"])
+        accepted = [n for n in ["HK 1", "JP 2", "香港 3", "SG 4", "HK Expired"] if name_filter.accepts(n)]
+        self.assertEqual(accepted, ["HK 1", "JP 2", "香港 3"])
+        self.assertEqual(name_filter.rejected, 2)
+
+    def test_group_free_patterns_share_one_regex(self) -> None:
+        self.assertEqual(len(sub2clash.compile_name_patterns(["香港", "日本", r"(?i)\bus\b", "x.*y"])), 1)
+        self.assertEqual(sub2clash.compile_name_patterns([]), [])
+
+    def test_leading_flags_stay_scoped(self) -> None:
+        include = [r"(?i)(?s)hk\b", r"(?x) jp \d  # japan", r"s\dg"]
+        name_filter = sub2clash.NameFilter(include)
+        accepted = [n for n in ["HK 1", "jp1", "JP1", "jp 1", "s1g", "S1G", "sg"] if name_filter.accepts(n)]
+        self.assertEqual(accepted, ["HK 1", "jp1", "s1g"])
+        self.assertEqual(len(sub2clash.compile_name_patterns(include)), 1)
+
+
+class ProbeTest(unittest.TestCase):
+    def proxies(self, count: int) -> List["sub2clash.Proxy"]:
+        return [sub2clash.SSProxy(f"node {i}", f"node{i}.test", 443, "aes-256-gcm", "pw") for i in range(count)]
+
+    def probe(
+        self, proxies: List["sub2clash.Proxy"], delays: Dict[str, Optional[float]], **settings: object
+    ) -> List[Optional[float]]:
+        """Probe with a stand-in connect: sleeps the host's delay, fails for None."""
+        calls: List[str] = []
+
+        async def connect(host: str, _port: int) -> None:
+            calls.append(host)
+            delay = delays[host]
+            if delay is None:
+                raise OSError("unreachable")
+            await sub2clash.asyncio.sleep(delay)
+
+        latencies = sub2clash.probe_latency(proxies, sub2clash.ProbeSettings(**settings), connect=connect)
+        self.assertEqual(sorted(calls), sorted(set(calls)))
+        return latencies
+
+    def test_nodes_are_ranked_and_the_fastest_grouped(self) -> None:
+        proxies = self.proxies(5)
+        proxies.append(sub2clash.SSProxy("node 0 again", "node0.test", 443, "aes-256-gcm", "pw"))
+        delays = {"node0.test": 0.15, "node1.test": None, "node2.test": 0.05, "node3.test": 0.1, "node4.test": 1.0}
+        settings = sub2clash.ProbeSettings(timeout=0.5, group_size=2, group_type="fallback")
+        latencies = self.probe(proxies, delays, timeout=0.5)
+        self.assertEqual([lat is None for lat in latencies], [False, True, False, False, True, False])
+        self.assertEqual(latencies[0], latencies[5])
+
+        select, auto = sub2clash.build_minimal_clash_yaml(proxies, "test", latencies, settings)["proxy-groups"]
+        self.assertEqual(
+            select["proxies"],
+            ["Auto", "node 2", "node 3", "node 0", "node 0 again", "node 1", "node 4", "DIRECT", "REJECT"],
+        )
+        self.assertEqual((auto["name"], auto["type"], auto["proxies"]), ("Auto", "fallback", ["node 2", "node 3"]))
+
+    def test_deadline_cancels_slow_connects(self) -> None:
+        t0 = time.perf_counter()
+        latencies = self.probe(self.proxies(2), {"node0.test": 0.0, "node1.test": 30.0}, timeout=60.0, deadline=0.3)
+        self.assertLess(time.perf_counter() - t0, 5.0)
+        self.assertIsNotNone(latencies[0])
+        self.assertIsNone(latencies[1])
+
+    def test_no_auto_group_when_nothing_is_reachable(self) -> None:
+        proxies = self.proxies(3)
+        latencies = self.probe(proxies, dict.fromkeys([p.server for p in proxies]))
+        self.assertEqual(latencies, [None, None, None])
+        groups = sub2clash.build_minimal_clash_yaml(proxies, "test", latencies)["proxy-groups"]
+        self.assertEqual([g["name"] for g in groups], ["Proxy"])
+        self.assertEqual(groups[0]["proxies"], ["node 0", "node 1", "node 2", "DIRECT", "REJECT"])
+
+
+class DaemonConfigTest(unittest.TestCase):
+    def load(self, config: str, **run_kwargs: object) -> Tuple[int, List["sub2clash.DaemonJob"]]:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+            f.write(config)
+        self.addCleanup(os.remove, f.name)
+        return sub2clash.load_daemon_config(f.name, dict(run_kwargs))
+
+    def test_stream_job_rejects_inherited_dedupe(self) -> None:
+        config = '{"sources": [{"url": "./a.txt", "output": "a.yaml", "stream": true}]}'
+        self.assertEqual(len(self.load(config, dedupe="first")[1]), 1)
+        for policy in ("last", "shortest", "longest"):
+            with self.subTest(dedupe=policy), self.assertRaises(ValueError):
+                self.load(config, dedupe=policy)
+        with self.assertRaises(ValueError):
+            self.load(config, probe=sub2clash.ProbeSettings())
+
+    def test_inherited_stream_rejects_job_dedupe(self) -> None:
+        config = '{"sources": [{"url": "./a.txt", "output": "a.yaml", "dedupe": "last"}]}'
+        self.assertEqual(self.load(config)[1][0].options, {"dedupe": "last"})
+        with self.assertRaises(ValueError):
+            self.load(config, stream=True)
+
+    def test_job_options_override_the_command_line(self) -> None:
+        config = '{"sources": [{"url": "./a.txt", "output": "a.yaml", "stream": false}]}'
+        self.assertEqual(len(self.load(config, stream=True, dedupe="last")[1]), 1)
+
+    def test_mistyped_values_are_rejected_with_the_entry(self) -> None:
+        bad = [
+            '"interval_minutes": true',
+            '"interval_minutes": null',
+            '"interval_minutes": "5"',
+            '"jitter": false',
+            '"max_interval_minutes": null',
+            '"include": 5',
+            '"exclude": ["过期", 1]',
+            '"include": {"hk": 1}',
+            '"stream": "no"',
+            '"adaptive": 1',
+            '"clash_meta": "yes"',
+        ]
+        for field in bad:
+            config = '{"sources": [{"url": "./a.txt", "output": "a.yaml"}, {"url": "./b.txt", "output": "b.yaml", %s}]}'
+            with self.subTest(field=field), self.assertRaisesRegex(ValueError, "第 2 个订阅"):
+                self.load(config % field)
+
+    def test_well_typed_values_are_kept(self) -> None:
+        config = (
+            '{"sources": [{"url": "./a.txt", "output": "a.yaml", "interval_minutes": 5, "jitter": 0.1,'
+            ' "include": "香港", "exclude": ["过期"], "stream": false, "adaptive": true, "clash_meta": true}]}'
+        )
+        job = self.load(config)[1][0]
+        self.assertEqual((job.interval, job.jitter, job.adaptive), (300.0, 0.1, True))
+        self.assertEqual(
+            job.options, {"allow_native_ssr": True, "stream": False, "include": ["香港"], "exclude": ["过期"]}
+        )
+
+
+# names the emitters must agree on: flags and other non-BMP emoji, CJK, YAML
+# indicators and reserved words, and characters that force double quotes
+AWKWARD_NAMES = [
+    "🇭🇰 香港 01",
+    "🇯🇵 日本 | IPLC ✈️",
+    "美国 x1.5 倍率",
+    "- dash",
+    "key: value",
+    "# hash",
+    "yes",
+    "null",
+    "0123",
+    "1e3",
+    " leading and trailing ",
+    "'single' \"double\"",
+    "tab\there",
+    "line\nbreak",
+    "nul\x00bell\x07",
+    "next\x85line",
+    "sep\u2028par\u2029",
+    "bom\ufeff",
+    "private\ue000use",
+    "𝔘𝔫𝔦𝔠𝔬𝔡𝔢",
+]
+
+
+@unittest.skipIf(sub2clash.yaml is None, "PyYAML is not installed")
+class EmitterEquivalenceTest(unittest.TestCase):
+    def config(self, names: List[str]) -> Tuple[List["sub2clash.Proxy"], Dict[str, object]]:
+        proxies: List[sub2clash.Proxy] = [
+            sub2clash.SSProxy(name, f"s{i}.example.com", 443, "aes-256-gcm", name) for i, name in enumerate(names)
+        ]
+        proxies.append(sub2clash.TrojanProxy("trojan", "t.example.com", 443, "pw", sni="t.example.com"))
+        return proxies, sub2clash.build_minimal_clash_yaml(proxies, "test")
+
+    def test_auto_emitter_matches_safe_dump(self) -> None:
+        for names in ([n for n in AWKWARD_NAMES if n.isascii()], AWKWARD_NAMES, ["HK 1", "JP 1"]):
+            with self.subTest(names=names[:3]):
+                config = self.config(names)[1]
+                expected = sub2clash.yaml.safe_dump(config, sort_keys=False, allow_unicode=True)
+                self.assertEqual(sub2clash.dump_yaml(config, "auto"), expected)
+                self.assertEqual(sub2clash.dump_yaml(config, "python"), expected)
+
+    def test_stream_writer_round_trips(self) -> None:
+        proxies, config = self.config(AWKWARD_NAMES)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stream.yaml")
+            self.assertEqual(sub2clash.write_clash_yaml_stream(proxies, "test", path), len(proxies))
+            with open(path, "r", encoding="utf-8") as f:
+                self.assertEqual(sub2clash.yaml.safe_load(f), config)
+
+    def test_stream_writer_round_trips_every_scalar(self) -> None:
+        for name in AWKWARD_NAMES:
+            with self.subTest(name=name):
+                self.assertEqual(sub2clash.yaml.safe_load(sub2clash.yaml_scalar(name)), name)
+
+
+class FileWatcherTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.mkdtemp(prefix="sub2clash-test-")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.source = os.path.join(self.tmp, "nodes.txt")
+        with open(self.source, "wb") as f:
+            f.write(SUBSCRIPTION)
+
+    def watchers(self) -> Iterator["sub2clash.FileWatcher"]:
+        """A fresh watcher per backend, each created just before it is used."""
+        for use_inotify in (True, False):
+            watcher = sub2clash.FileWatcher([self.source], debounce=0.1, poll_interval=0.05, use_inotify=use_inotify)
+            if use_inotify and watcher.backend != "inotify":
+                watcher.close()
+                continue
+            try:
+                yield watcher
+            finally:
+                watcher.close()
+
+    def later(self, action: Callable[[], None], delay: float = 0.2) -> None:
+        timer = threading.Timer(delay, action)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def rename_over(self, data: bytes) -> None:
+        tmp_path = os.path.join(self.tmp, ".nodes.txt.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.source)
+
+    def test_detects_rename_over(self) -> None:
+        for watcher in self.watchers():
+            with self.subTest(backend=watcher.backend):
+                self.later(lambda: self.rename_over(SUBSCRIPTION + b"\n" + watcher.backend.encode()))
+                self.assertEqual(watcher.wait(timeout=5), [os.path.abspath(self.source)])
+
+    def test_ignores_other_files_and_times_out(self) -> None:
+        for watcher in self.watchers():
+            with self.subTest(backend=watcher.backend):
+                self.later(lambda: open(os.path.join(self.tmp, "other.txt"), "w").close())
+                t0 = time.monotonic()
+                self.assertEqual(watcher.wait(timeout=0.6), [])
+                self.assertGreaterEqual(time.monotonic() - t0, 0.55)
+
+    def test_burst_is_reported_once(self) -> None:
+        for watcher in self.watchers():
+            with self.subTest(backend=watcher.backend):
+
+                def burst() -> None:
+                    for i in range(5):
+                        self.rename_over(SUBSCRIPTION + b"\n#" + str(i).encode())
+                        time.sleep(0.02)
+
+                self.later(burst)
+                self.assertEqual(len(watcher.wait(timeout=5)), 1)
+                self.assertEqual(watcher.wait(timeout=0.4), [])
+
+    def test_wakeup_ends_wait_early(self) -> None:
+        for watcher in self.watchers():
+            with self.subTest(backend=watcher.backend):
+                self.later(watcher.wakeup)
+                t0 = time.monotonic()
+                self.assertEqual(watcher.wait(timeout=5), [])
+                self.assertLess(time.monotonic() - t0, 2)
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "needs SIGUSR1")
+    def test_signal_wakes_the_watch_loop(self) -> None:
+        watcher = sub2clash.FileWatcher([self.source])
+        self.addCleanup(watcher.close)
+        signals = sub2clash.RefreshSignals(wake=watcher.wakeup)
+        for signum in (signal.SIGHUP, signal.SIGUSR1):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        self.assertTrue(signals.install())
+        self.later(lambda: os.kill(os.getpid(), signal.SIGUSR1))
+        t0 = time.monotonic()
+        self.assertEqual(watcher.wait(timeout=5), [])
+        self.assertLess(time.monotonic() - t0, 2)
+        self.assertEqual(signals.take(), (False, True))
+
+
+class ConfigServerTest(StandInTestCase):
+    def test_forced_refresh_rerenders_a_fresh_config(self) -> None:
+        self.server.routes["/sub"] = etag_route(SUBSCRIPTION)
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = sub2clash.ConfigServer([self.server.url("/sub")], "test", max_age=3600, cache_dir=self.cache_dir)
+            server.get()
+            server.get()
+            self.assertEqual(self.server.statuses("/sub"), [200])
+            server.exclude = ["HK"]
+            refreshed = server.get(force=True)
+        self.assertEqual(self.server.statuses("/sub"), [200, 304])
+        self.assertNotIn(b"HK 1", refreshed.body)
+
+
+if __name__ == "__main__":
+    unittest.main()